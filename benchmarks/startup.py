@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import os
+import sys
+import time
+import shutil
+import statistics
+import subprocess
+
+from argparse import ArgumentParser
+
+COMMANDS = (
+    (("--version",), 200),
+    (("list", "--only-channel-name"), 200),
+    (("search", "--help"), 1000),
+)
+
+
+def conda_local_cmd():
+    exe = shutil.which("conda-local")
+    if exe:
+        return [exe]
+    return [sys.executable, "-c", "import sys; from conda_local.main import main; sys.exit(main())"]
+
+
+def timeit(cmd, repeat=5, env=None):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, env=env)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def import_times(cmd, top=10, env=None):
+    res = subprocess.run(cmd[:1] + ["-X", "importtime"] + cmd[1:], stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE, universal_newlines=True, env=env)
+    rows = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    p = ArgumentParser(description="Measure conda-local startup time against a budget.")
+    p.add_argument("-n", "--repeat", type=int, default=5,
+                   help="runs per command, the median is reported, %(default)s by default")
+    p.add_argument("--scale", type=float, default=1.0,
+                   help="multiply all budgets by this factor, %(default)s by default")
+    p.add_argument("--importtime", action="store_true",
+                   help="show the slowest imports of commands over budget")
+    args = p.parse_args()
+    env = dict(os.environ, LOCAL_CONDA_NO_DAEMON="1")
+    base = conda_local_cmd()
+    if subprocess.run(base + ["--version"], stdout=subprocess.DEVNULL,
+                      stderr=subprocess.DEVNULL, env=env).returncode:
+        sys.exit("conda-local is not installed in this environment")
+    failed = 0
+    for argv, budget in COMMANDS:
+        budget *= args.scale
+        cmd = base + list(argv)
+        ms = timeit(cmd, args.repeat, env)
+        ok = ms <= budget
+        failed += not ok
+        print("%-35s %8.1f ms  (budget %.0f ms)  %s" % (
+            " ".join(argv), ms, budget, ok and "ok" or "FAIL"))
+        if not ok and args.importtime and base[0] == sys.executable:
+            for us, name in import_times(cmd, env=env):
+                print("    %8.1f ms  %s" % (us / 1000, name))
+    return failed and 1 or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,33 @@
-from . import main_create
-from . import main_update
-from . import main_search
-from . import main_remove
-from . import main_install
-from . import main_list
-from . import main_cache
-from . import main_download
+from importlib import import_module
+
+COMMANDS = (
+    ("install", "main_install"),
+    ("create", "main_create"),
+    ("update", "main_update"),
+    ("remove", "main_remove"),
+    ("search", "main_search"),
+    ("download", "main_download"),
+    ("cache", "main_cache"),
+    ("list", "main_list"),
+    ("ls", "main_list"),
+    ("daemon", "main_daemon"),
+)
+
+
+def load_command(module):
+    return import_module("." + module, __name__)
+
+
+def configure_command(sub_parsers, name, module):
+    mod = load_command(module)
+    if module == "main_" + name:
+        mod.configure_parser(sub_parsers)
+    else:
+        mod.configure_parser(sub_parsers, name=name)
+
+
+def find_command(argv):
+    for arg in argv:
+        if not arg.startswith("-"):
+            return arg
+    return None
@@ -2,6 +2,8 @@
 # coding:utf-8
 
 from ..src import *
+from ..index import *
+from ..engine import *
 
 
 def configure_parser(sub_parsers):
@@ -37,7 +39,41 @@ def configure_parser(sub_parsers):
         action="append",
         help="channel to cache",
     )
+    p.add_argument(
+        '-f', "--force",
+        action='store_true',
+        default=False,
+        help="Find mirror channels and download full repodata again, ignore all cached states.",
+    )
+    p.add_argument(
+        '-z', "--compressed",
+        action='store_true',
+        default=False,
+        help="Prefer compressed repodata (repodata.json.zst or .bz2) if the mirror provides it.",
+    )
+    p.add_argument(
+        "--jlap",
+        action='store_true',
+        default=False,
+        help="Update cached repodata by incremental patches (repodata.jlap) if the mirror provides them.",
+    )
+    p.add_argument(
+        "-t", "--threads",
+        metavar="int",
+        type=int,
+        default=DEFAULT_THREADS * 2,
+        help="max concurrent requests used to find mirror channels, %(default)s by default",
+    )
+    add_parser_connections(p)
+    p.add_argument(
+        "--ttl",
+        metavar="seconds",
+        type=int,
+        default=DEFAULT_DISCOVER_TTL,
+        help="reuse the cached channels list of a mirror within this time, %(default)s by default, 0 to disable",
+    )
     add_logging_debug(p)
+    add_parser_timings(p)
     p.set_defaults(func='.cli.main_cache.execute')
 
 
@@ -49,21 +85,23 @@ def execute(args):
     channels = []
     if args.channel:
         mirrors = []
+        confirmed = set()
         for chn in args.channel:
             cset = set()
             if "://" in chn:
                 c = LocalChannels.from_url(chn).to_channel(local=False)
                 cset.add(c)
             elif chn in localrepo.channels:
-                url = localrepo.channels_url[chn]
-                c = LocalChannels.from_url(
-                    url).to_channel(local=False, name=chn)
-                cset.add(c)
+                for url in localrepo.channels_mirrors.get(chn) or [localrepo.channels_url[chn]]:
+                    c = LocalChannels.from_url(
+                        url).to_channel(local=False, name=chn)
+                    cset.add(c)
             else:
                 for c in LocalChannels.from_name(chn):
                     cset.add(c.to_channel(local=False))
             for c in cset:
-                if c.name in localrepo.channels:
+                if c.name in localrepo.channels and c.name not in confirmed:
+                    confirmed.add(c.name)
                     try:
                         common.confirm_yn("WARNING: conda channel '%s' already cached\n" % c +
                                           "\nUpdate",
@@ -79,7 +117,7 @@ def execute(args):
     for ms in mirrors[:]:
         n = urlsplit(ms)
         md = join(LocalCondaRepo.defaut_repo_dir,
-                  n.hostname or "", n.path.strip("/"))
+                  n.netloc, n.path.strip("/"))
         if os.path.isfile(join(md, ".urls.json")) and not args.channel:
             try:
                 common.confirm_yn("WARNING: conda mirror '%s' already cached\n" % ms +
@@ -88,34 +126,88 @@ def execute(args):
                                   dry_run=False)
             except CondaSystemExit:
                 mirrors.remove(ms)
-    if mirrors:
-        with Spinner("Find channels from %s" % ", ".join(mirrors), fail_message="failed\n"):
+    if len(set(c.name for c in channels)) < len(channels):
+        ranked = fast_url(set(c.base_url for c in channels),
+                          suffix=join(context.subdirs[0], REPODATA_FN))
+        channels.sort(key=lambda c: ranked.index(c.base_url))
+    if len(mirrors) > 1:
+        mirrors = fast_url(mirrors)
+    url_cached = {}
+    repo_states = {}
+    alternates = {}
+    lock = Lock()
+
+    def fetch_repodata(chs, subdir):
+        for n, c in enumerate(chs, 1):
+            url = join(c.base_url, subdir, REPODATA_FN)
+            outfile = join(LocalCondaRepo.defaut_repo_dir,
+                           c.channel_location, c.name, subdir, REPODATA_FN)
+            mkdir(dirname(outfile))
+            with lock:
+                state_file = join(LocalCondaRepo.defaut_repo_dir,
+                                  c.channel_location, REPODATA_STATE_FN)
+                if state_file not in repo_states:
+                    repo_states[state_file] = RepodataState(state_file)
+                state = repo_states[state_file].get(c.name, subdir)
+                if args.force:
+                    state.clear()
+            try:
+                Download.download_repodata(url, outfile, state=state,
+                                           compressed=args.compressed, jlap=args.jlap,
+                                           segments=args.segments)
+            except Exception as e:
+                get_mirror_scores().update(url, error=True)
+                if n < len(chs):
+                    LOCAL_CONDA_LOG.info(
+                        "download %s failed, retry from %s", url, chs[n].base_url)
+                    continue
+                raise
+            try:
+                ensure_index(outfile)
+                if load_stats(outfile) is None:
+                    build_stats(outfile, state.get("blake2_256"))
+            except Exception as e:
+                LOCAL_CONDA_LOG.warning(
+                    "Build package index of %s failed: %s", outfile, e)
+            with lock:
+                url_file = join(LocalCondaRepo.defaut_repo_dir,
+                                c.channel_location, ".urls.json")
+                url_cached.setdefault(url_file, {})[
+                    c.name] = dirname(c.url())
+            return
+
+    def submit_channel(pool, c):
+        if c.name in alternates:
+            alternates[c.name].append(c)
+            return
+        alternates[c.name] = [c]
+        for u in c.urls():
+            subdir = basename(u)
+            outfile = join(LocalCondaRepo.defaut_repo_dir,
+                           c.channel_location, c.name, subdir, REPODATA_FN)
+            pool.submit(join(u, REPODATA_FN), outfile,
+                        fetch_repodata, alternates[c.name], subdir)
+
+    if channels or mirrors:
+        print("\nDownload channels repodata, (max %d connections)" %
+              args.max_connections)
+        tqdm.set_lock(RLock())
+        with DownloadEngine(args.max_connections, args.per_host) as p:
+            for c in channels:
+                submit_channel(p, c)
             for ms in mirrors:
-                chs = get_repo_channels(ms)
-                if not len(chs):
+                LOCAL_CONDA_LOG.info("Find channels from %s", ms)
+                n = 0
+                for c in iter_repo_channels(ms, threads=args.threads,
+                                            ttl=0 if args.force else args.ttl):
+                    submit_channel(p, c)
+                    n += 1
+                if not n:
                     raise CondaError(
                         "%s is not a correct conda mirror url or there is no channels in this mirror." % ms)
-                channels.extend(chs)
-    url_cached = {}
-    if channels:
-        download_args = []
-        for c in channels:
-            for u in c.urls():
-                u = join(u, REPODATA_FN)
-                subdir = basename(dirname(u))
-                outfile = join(LocalCondaRepo.defaut_repo_dir,
-                               c.channel_location, c.name, subdir, REPODATA_FN)
-                mkdir(dirname(outfile))
-                download_args.append((u, outfile))
-            url_file = join(LocalCondaRepo.defaut_repo_dir,
-                            c.channel_location, ".urls.json")
-            url_cached.setdefault(url_file, {})[c.name] = dirname(c.url())
-        if download_args:
-            nthreads = min(DEFAULT_THREADS, len(download_args))
-            print("\nDownload channels repodata, (%d threads)" % nthreads)
-            with ThreadPoolExecutor(nthreads) as p:
-                for url, outfile in download_args:
-                    p.submit(Download.download_file, url, outfile)
+    get_mirror_scores().save()
+    for rs in repo_states.values():
+        rs.save()
     if url_cached:
         for f, info in url_cached.items():
             if isfile(f):
@@ -126,4 +218,5 @@ def execute(args):
             with open(f, "w") as fo:
                 data = {"channels": info, "time_stmp": int(time.time())}
                 json.dump(data, fo, indent=2)
+        localrepo.update_registry(url_cached.keys())
         LOCAL_CONDA_LOG.info("Cache repodata done.")
@@ -47,9 +47,13 @@ def configure_parser(sub_parsers):
         default=False,
     )
     add_parser_local_solver(p)
+    add_parser_solve_cache(p)
+    add_parser_prune(p)
+    add_parser_connections(p)
     add_parse_no_default_channels(p)
     add_parser_spec(p)
     add_parser_prefix(p)
+    add_parser_timings(p)
     p.set_defaults(func='.cli.main_create.execute')
 
 
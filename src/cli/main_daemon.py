@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+from ..src import *
+from ..daemon import *
+
+
+def configure_parser(sub_parsers):
+    help_desc = "Manage a resident conda local daemon serving search, list and dry-run commands."
+    example = dedent("""
+        Examples:
+        
+            conda local daemon start
+            conda local daemon status
+            conda local daemon stop
+        """)
+    p = sub_parsers.add_parser(
+        'daemon',
+        help=help_desc,
+        epilog=example,
+    )
+    p.add_argument(
+        'action',
+        choices=["start", "stop", "status"],
+        help="start, stop or show status of the daemon",
+    )
+    p.add_argument(
+        '--socket',
+        default=DAEMON_SOCKET,
+        metavar="<file>",
+        help="unix socket of the daemon, %(default)s by default",
+    )
+    p.add_argument(
+        '--log',
+        default=os.devnull,
+        metavar="<file>",
+        help="log file of a background daemon, %(default)s by default",
+    )
+    p.add_argument(
+        '--foreground',
+        action="store_true",
+        default=False,
+        help="run the daemon in foreground",
+    )
+    add_logging_debug(p)
+    p.set_defaults(func='.cli.main_daemon.execute')
+
+
+def execute(args):
+    status = daemon_status(args.socket)
+    if args.action == "status":
+        if not status:
+            print("conda local daemon is not running")
+            return 1
+        print("conda local daemon is running:")
+        print("  - pid: %s" % status["pid"])
+        print("  - socket: %s" % status["socket"])
+        print("  - started: %s" % time.strftime(
+            "%F %X", time.localtime(status["started"])))
+        print("  - served: %s" % status["served"])
+    elif args.action == "stop":
+        if not status:
+            print("conda local daemon is not running")
+            return
+        daemon_request({"cmd": "stop"}, args.socket, timeout=5)
+        print("conda local daemon (pid %s) stopped" % status["pid"])
+    elif status:
+        print("conda local daemon is already running (pid %s)" % status["pid"])
+    elif args.foreground:
+        serve(args.socket)
+    else:
+        status = start_daemon(args.socket, args.log)
+        if not status:
+            raise CondaError("Start conda local daemon failed")
+        print("conda local daemon started (pid %s)" % status["pid"])
@@ -3,6 +3,8 @@
 
 
 from ..src import *
+from ..index import *
+from ..registry import show_channel_names
 
 
 def configure_parser(sub_parsers, name="list"):
@@ -31,7 +33,22 @@ def configure_parser(sub_parsers, name="list"):
         default=False,
         help="only show cached channel names",
     )
+    p.add_argument(
+        '--json',
+        action="store_true",
+        default=False,
+        help="output packages of '-c' channels as newline-delimited json",
+    )
+    p.add_argument(
+        '--limit',
+        type=int,
+        default=0,
+        metavar="<int>",
+        help="output at most this many packages of '-c' channels",
+    )
+    add_parser_jobs(p)
     add_logging_debug(p)
+    add_parser_timings(p)
     p.set_defaults(func='.cli.main_list.execute')
 
 
@@ -39,9 +56,7 @@ def execute(args):
     localrepo = LocalCondaRepo()
     localrepo.parse_repos()
     if args.only_channel_name:
-        print("all local cached channels:")
-        for cn in sorted(localrepo.channels.keys()):
-            print("  - {}".format(cn))
+        show_channel_names(localrepo.channels)
         sys.exit()
     chn_info = nested_dict()
     channels = {}
@@ -55,31 +70,29 @@ def execute(args):
                     channels[c.name] = localrepo.channels[c.name]
             else:
                 raise CondaError("No channel %s cached." % args.channel)
+        return list_packages(args, channels)
     with Spinner("Load cached conda repodata", fail_message="failed\n"):
+        sources = []
         for chn, channel in localrepo.channels.items():
-            if channels and chn not in channels:
-                continue
             url = localrepo.channels_url[chn]
             chn_info[chn]["url"] = cstring(url, 4, 34)
             for subdir in context.subdirs:
                 repofile = join(channel.location, channel.name,
                                 subdir, REPODATA_FN)
                 if isfile(repofile):
-                    try:
-                        with open(repofile) as fi:
-                            repodata = json.load(fi)
-                    except:
-                        # LOCAL_CONDA_LOG.warn(
-                        # "\nLoad channel '%s' error, removed this channel.", chn)
-                        os.remove(repofile)
-                        continue
-                    subdir = repodata['info'].get(
-                        'subdir', basename(dirname(repofile)))
-                    chn_info[chn]["cached"][subdir] = repodata["packages"]
-                    chn_info[chn]["packages"][subdir] = len(
-                        repodata["packages"])
-                    chn_info[chn]["size"][subdir] = human_bytes(
-                        sum([p["size"] for _, p in repodata["packages"].items()]))
+                    sources.append((chn, subdir, repofile))
+        repofiles = [repofile for _, _, repofile in sources]
+        if args.jobs > 1 and len(sources) > 1 and any(load_stats(f) is None for f in repofiles):
+            with ProcessPoolExecutor(min(args.jobs, len(sources))) as pool:
+                stats = list(pool.map(source_stats, repofiles))
+        else:
+            stats = [source_stats(f) for f in repofiles]
+        for (chn, subdir, repofile), st in zip(sources, stats):
+            if st is None:
+                os.remove(repofile)
+                continue
+            chn_info[chn]["packages"][subdir] = st["packages"]
+            chn_info[chn]["size"][subdir] = human_bytes(st["size"])
         for uf in localrepo.url_files:
             if isfile(uf):
                 with open(uf) as fi:
@@ -92,30 +105,38 @@ def execute(args):
         if not len(chn_info):
             raise CondaError(
                 "No cached repodata found, you might need to run 'conda local cache'")
-    if not args.channel:
-        for cn, info in sorted(chn_info.items(), key=lambda x: sum(list(x[1]['packages'].values())), reverse=True):
-            print(cstring(cn + ":", 1, 34))
-            for k in ['cache time', 'url', 'packages', 'size']:
-                if k in ['cache time', "url"]:
-                    v = "  - " + k + ": " + info[k]
+    for cn, info in sorted(chn_info.items(), key=lambda x: sum(list(x[1]['packages'].values())), reverse=True):
+        print(cstring(cn + ":", 1, 34))
+        for k in ['cache time', 'url', 'packages', 'size']:
+            if k in ['cache time', "url"]:
+                v = "  - " + k + ": " + info[k]
+                print(v)
+            elif k in ['packages', 'size']:
+                print("  - " + k + ":")
+                for arch, value in info[k].items():
+                    v = "  " + "  - " + arch + ": " + str(value)
                     print(v)
-                elif k in ['packages', 'size']:
-                    print("  - " + k + ":")
-                    for arch, value in info[k].items():
-                        v = "  " + "  - " + arch + ": " + str(value)
-                        print(v)
-            print()
-    else:
-        records = set()
-        for c in args.channel:
-            if c in chn_info:
-                for sub, info in chn_info[c]["cached"].items():
-                    for rec in info.values():
-                        records.add(
-                            (rec["name"], rec["version"], rec["build"], c))
-        records = sorted(records, key=lambda x: (
-            x[3], x[0], VersionOrder(x[1]), x[2]))
+        print()
+
+
+def list_packages(args, channels):
+    if not channels:
+        raise CondaError(
+            "No cached repodata found, you might need to run 'conda local cache'")
+    if not args.json:
         print('# %-18s %15s %30s  %-20s' %
               ("Name", "Version", "Build", "Channel"))
-        for rec in records:
-            print('%-20s %15s %30s  %-20s' % (rec[0], rec[1], rec[2], rec[3]))
+    n = 0
+    for chn in sorted(channels):
+        channel = channels[chn]
+        repofiles = [join(channel.location, channel.name, subdir, REPODATA_FN)
+                     for subdir in context.subdirs]
+        for name, version, build in iter_packages(filter(isfile, repofiles)):
+            if args.json:
+                print(json.dumps({"name": name, "version": version,
+                                  "build": build, "channel": chn}))
+            else:
+                print('%-20s %15s %30s  %-20s' % (name, version, build, chn))
+            n += 1
+            if args.limit and n >= args.limit:
+                return
@@ -52,6 +52,8 @@ def configure_parser(sub_parsers):
     )
     add_parser_prefix(p)
     add_parser_local_solver(p)
+    add_parser_solve_cache(p)
+    add_parser_timings(p)
     p.set_defaults(func='.cli.main_remove.execute')
 
 
@@ -99,6 +101,9 @@ def execute(args):
         log_channel_used(channels)
         solver = localSolver(key=args.solver)(prefix, channels,
                                               context.subdirs, specs_to_remove=specs)
+        if not args.no_solve_cache:
+            from ..solve import SolveCache
+            solver.solve_cache = SolveCache()
         txn = solver.solve_for_transaction()
         if txn.nothing_to_do:
             raise PackagesNotFoundError(args.package_names)
@@ -2,6 +2,12 @@
 # coding:utf-8
 
 from ..src import *
+from ..index import *
+
+import heapq
+
+from functools import lru_cache
+from itertools import chain, islice
 
 
 def configure_parser(sub_parsers):
@@ -31,17 +37,45 @@ def configure_parser(sub_parsers):
     )
     add_parser_local_solver(p)
     add_parse_no_default_channels(p)
+    add_parser_jobs(p)
     p.add_argument(
         '-d', "--detail",
         action="store_true",
         help="Show detailed information about each package."
     )
+    p.add_argument(
+        "--latest",
+        action="store_true",
+        help="Only show the newest build of each package.",
+    )
+    p.add_argument(
+        "--limit",
+        type=int,
+        default=0,
+        metavar="<int>",
+        help="Show at most this many results.",
+    )
+    p.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        metavar="<int>",
+        help="Skip this many results before showing any.",
+    )
+    p.add_argument(
+        "--page",
+        type=int,
+        default=0,
+        metavar="<int>",
+        help="Show this page of results, pages are '--limit' (default 20) results long.",
+    )
     p.add_argument(
         'match_spec',
         default='*',
         nargs='?',
         help=SUPPRESS,
     )
+    add_parser_timings(p)
     p.set_defaults(func='.cli.main_search.execute')
 
 
@@ -64,18 +98,48 @@ def _process_query_result(result_str, records=True):
     return result
 
 
-def _search(spec, channels, subdirs, key=None):
+@lru_cache(maxsize=2 ** 14)
+def version_key(version):
+    return VersionOrder(version)
+
+
+def record_key(rec):
+    return (rec.name, version_key(rec.version), rec.build)
+
+
+def _select(records, latest=False, start=0, stop=None):
+    if latest:
+        newest = {}
+        for rec in records:
+            if rec.name not in newest or record_key(rec) > record_key(newest[rec.name]):
+                newest[rec.name] = rec
+        records = newest.values()
+    if stop is None:
+        return sorted(records, key=record_key)[start:]
+    return heapq.nsmallest(stop, records, key=record_key)[start:]
+
+
+def _search(spec, channels, subdirs, key=None, latest=False, start=0, stop=None, jobs=1):
+    if stop is not None:
+        groups = stream_index(spec, channels, subdirs)
+        if groups is not None:
+            try:
+                return list(islice(chain.from_iterable(
+                    _select(g, latest) for g in groups), start, stop))
+            finally:
+                groups.close()
+    matches = query_index(spec, channels, subdirs, jobs)
+    if matches is not None:
+        return _select(matches, latest, start, stop)
     if get_solver_key(key=key) == "classic":
-        return sorted(SubdirData.query_all(spec, channels, subdirs),
-                      key=lambda rec: (rec.name, VersionOrder(rec.version), rec.build))
+        return _select(SubdirData.query_all(spec, channels, subdirs), latest, start, stop)
     try:
         from conda_libmamba_solver.solver import LibMambaIndexHelper
     except ImportError:
-        return sorted(SubdirData.query_all(spec, channels, subdirs),
-                      key=lambda rec: (rec.name, VersionOrder(rec.version), rec.build))
+        return _select(SubdirData.query_all(spec, channels, subdirs), latest, start, stop)
     index = LibMambaIndexHelper([], channels, subdirs)
     query = spec.original_spec_str
-    return _process_query_result(index.search(query))
+    return _select(_process_query_result(index.search(query)), latest, start, stop)
 
 
 def execute(args):
@@ -91,13 +155,22 @@ def execute(args):
     channel_urls = LocalConda.local_channels(
         new_channel_names(_channel_urls, args), local_repo)
     log_channel_used(channel_urls)
-    matches = _search(spec, channel_urls, subdirs, key=args.solver)
-    if not matches and spec.get_exact_value("name"):
+    limit = args.limit or (args.page and 20)
+    start = args.offset + max(args.page - 1, 0) * limit
+    stop = limit and start + limit or None
+    select = dict(key=args.solver, latest=args.latest,
+                  start=start, stop=stop, jobs=args.jobs)
+    matches = _search(spec, channel_urls, subdirs, **select)
+    if not matches and not start and spec.get_exact_value("name"):
         flex_spec = MatchSpec(spec, name="*%s*" % spec.name)
         if not context.json:
             print("No match found for: %s. Search: %s" % (spec, flex_spec))
-        matches = _search(flex_spec, channel_urls, subdirs, key=args.solver)
-    if not matches:
+        matches = _search(flex_spec, channel_urls, subdirs, **select)
+    if not matches and not start:
+        if spec.get_exact_value("name") and not context.json:
+            names = similar_names(spec.name, channel_urls, subdirs)
+            if names:
+                print("Did you mean: %s" % ", ".join(names))
         channels_urls = tuple(calculate_channel_urls(
             channel_urls=_channel_urls,
             platform=subdirs[0],
@@ -48,6 +48,9 @@ def configure_parser(sub_parsers):
         help="Do not ask for confirmation.",
     )
     add_parser_local_solver(p)
+    add_parser_solve_cache(p)
+    add_parser_prune(p)
+    add_parser_connections(p)
     add_parse_no_default_channels(p)
     p.add_argument(
         'packages',
@@ -57,6 +60,7 @@ def configure_parser(sub_parsers):
         help="Packages to update in the conda environment.",
     )
     add_parser_prefix(p)
+    add_parser_timings(p)
     p.set_defaults(func='.cli.main_update.execute')
 
 
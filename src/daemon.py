@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import socketserver
+
+from io import TextIOBase
+from threading import Thread
+from os.path import join, exists, isdir
+from contextlib import redirect_stdout, redirect_stderr
+
+DAEMON_SOCKET = os.getenv("LOCAL_CONDA_DAEMON_SOCKET", "") or join(
+    os.getenv("LOCAL_CONDA_DIR", "") or join(os.environ["HOME"], ".conda"), ".daemon.sock")
+DAEMON_COMMANDS = ("search", "list", "ls")
+DAEMON_DRY_RUN_COMMANDS = ("install", "create", "update", "remove", "download")
+
+
+def is_daemon_command(argv):
+    if not argv:
+        return False
+    if argv[0] in DAEMON_COMMANDS:
+        return True
+    return argv[0] in DAEMON_DRY_RUN_COMMANDS and "--dry-run" in argv
+
+
+def daemon_connect(sockfile=DAEMON_SOCKET, timeout=None):
+    if not exists(sockfile):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(sockfile)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def daemon_request(message, sockfile=DAEMON_SOCKET, timeout=None):
+    sock = daemon_connect(sockfile, timeout)
+    if sock is None:
+        return None
+    with sock, sock.makefile("r", encoding="utf-8") as fi:
+        sock.sendall((json.dumps(message) + "\n").encode())
+        line = fi.readline()
+    return line and json.loads(line) or None
+
+
+def daemon_call(argv, sockfile=DAEMON_SOCKET):
+    if os.getenv("LOCAL_CONDA_NO_DAEMON") or not is_daemon_command(argv):
+        return None
+    sock = daemon_connect(sockfile)
+    if sock is None:
+        return None
+    served = False
+    with sock, sock.makefile("r", encoding="utf-8") as fi:
+        sock.sendall((json.dumps({
+            "argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}) + "\n").encode())
+        for line in fi:
+            msg = json.loads(line)
+            if "out" in msg:
+                sys.stdout.write(msg["out"])
+                sys.stdout.flush()
+            elif "err" in msg:
+                sys.stderr.write(msg["err"])
+                sys.stderr.flush()
+            elif "code" in msg:
+                return msg["code"]
+            elif msg.get("served") is False:
+                return None
+            served = True
+    return 1 if served else None
+
+
+class StreamWriter(TextIOBase):
+
+    def __init__(self, wfile, key):
+        self.wfile = wfile
+        self.key = key
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def write(self, s):
+        if s:
+            self.wfile.write((json.dumps({self.key: s}) + "\n").encode())
+        return len(s)
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        reply = self.server.dispatch(json.loads(line), self.wfile)
+        if reply is not None:
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+
+
+class LocalCondaDaemon(socketserver.UnixStreamServer):
+
+    def __init__(self, sockfile=DAEMON_SOCKET):
+        self.sockfile = sockfile
+        self.started = time.time()
+        self.served = 0
+        self.signature = None
+        socketserver.UnixStreamServer.__init__(self, sockfile, DaemonHandler)
+        os.chmod(sockfile, 0o600)
+
+    def status(self):
+        return {"pid": os.getpid(), "socket": self.sockfile,
+                "started": self.started, "served": self.served}
+
+    def dispatch(self, request, wfile):
+        cmd = request.get("cmd")
+        if cmd == "status":
+            return self.status()
+        if cmd == "stop":
+            Thread(target=self.shutdown, daemon=True).start()
+            return self.status()
+        return self.run_command(request, wfile)
+
+    def repodata_signature(self):
+        from .src import LocalCondaRepo, REPODATA_FN
+        localrepo = LocalCondaRepo()
+        localrepo.parse_repos()
+        signature = []
+        for channel in localrepo.channels.values():
+            chdir = join(channel.location, channel.name)
+            if not isdir(chdir):
+                continue
+            for subdir in sorted(os.listdir(chdir)):
+                repofile = join(chdir, subdir, REPODATA_FN)
+                if exists(repofile):
+                    st = os.stat(repofile)
+                    signature.append((repofile, st.st_size, st.st_mtime))
+        return signature
+
+    def refresh(self):
+        from .src import SubdirData, PrefixData, PackageCacheData
+        caches = [PrefixData, PackageCacheData]
+        signature = self.repodata_signature()
+        if signature != self.signature:
+            caches.append(SubdirData)
+            self.signature = signature
+        for cls in caches:
+            cache = getattr(cls, "_cache_", None)
+            if isinstance(cache, dict):
+                cache.clear()
+
+    def run_command(self, request, wfile):
+        from .main import create_parser, run
+        from .src import LOCAL_CONDA_LOG
+        try:
+            args = create_parser(request["argv"]).parse_args(request["argv"])
+        except SystemExit:
+            return {"served": False}
+        if not is_daemon_command(request["argv"]):
+            return {"served": False}
+        environ, cwd = dict(os.environ), os.getcwd()
+        handlers = {s: signal.getsignal(s) for s in (signal.SIGINT, signal.SIGTERM)}
+        out, err = StreamWriter(wfile, "out"), StreamWriter(wfile, "err")
+        try:
+            os.environ.clear()
+            os.environ.update(request.get("env", environ))
+            os.chdir(request.get("cwd", cwd))
+            self.refresh()
+            with redirect_stdout(out), redirect_stderr(err):
+                try:
+                    code = run(args)
+                except SystemExit as e:
+                    code = e.code
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+            os.chdir(cwd)
+            for s, h in handlers.items():
+                signal.signal(s, h)
+            LOCAL_CONDA_LOG.setLevel(20)
+        self.served += 1
+        return {"code": code if isinstance(code, int) else int(bool(code))}
+
+
+def daemon_status(sockfile=DAEMON_SOCKET):
+    return daemon_request({"cmd": "status"}, sockfile, timeout=5)
+
+
+def serve(sockfile=DAEMON_SOCKET):
+    if exists(sockfile):
+        os.remove(sockfile)
+    server = LocalCondaDaemon(sockfile)
+    signal.signal(signal.SIGTERM, lambda *a: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if exists(sockfile):
+            os.remove(sockfile)
+
+
+def start_daemon(sockfile=DAEMON_SOCKET, logfile=os.devnull, timeout=30):
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        end = time.time() + timeout
+        while time.time() < end:
+            status = daemon_status(sockfile)
+            if status:
+                return status
+            time.sleep(0.1)
+        return None
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    with open(os.devnull) as fi, open(logfile, "a") as fo:
+        os.dup2(fi.fileno(), 0)
+        os.dup2(fo.fileno(), 1)
+        os.dup2(fo.fileno(), 2)
+    try:
+        serve(sockfile)
+    finally:
+        os._exit(0)
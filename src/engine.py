@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import asyncio
+
+from functools import partial
+from collections import deque
+from concurrent.futures import wait
+
+from .utils import *
+
+
+class HostLimiter(object):
+
+    window = 5.0
+
+    def __init__(self, max_limit, limit=4):
+        self.max_limit = max(1, max_limit)
+        self.limit = max(1, min(limit, self.max_limit))
+        self.active = 0
+        self.best_rate = 0.0
+        self.errors = 0
+        self.history = deque()
+        self.cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self, ok, nbytes):
+        async with self.cond:
+            self.active -= 1
+            self.adjust(ok, nbytes)
+            self.cond.notify_all()
+
+    def rate(self, now):
+        while self.history and now - self.history[0][0] > self.window:
+            self.history.popleft()
+        if not self.history:
+            return 0.0
+        span = max(now - self.history[0][0], 1.0)
+        return sum(b for _, b in self.history) / span
+
+    def adjust(self, ok, nbytes):
+        if not ok:
+            self.errors += 1
+            self.limit = max(1, self.limit // 2)
+            return
+        now = time.time()
+        self.history.append((now, nbytes))
+        rate = self.rate(now)
+        if rate >= self.best_rate * 1.05:
+            self.best_rate = rate
+            self.limit = min(self.max_limit, self.limit + 1)
+        elif rate < self.best_rate * 0.8 and self.limit > 1:
+            self.limit -= 1
+            self.best_rate *= 0.9
+
+
+class DownloadEngine(object):
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, per_host=DEFAULT_PER_HOST):
+        self.max_connections = max(1, max_connections)
+        self.per_host = max(1, min(per_host, self.max_connections))
+        self.limiters = {}
+        self.futures = []
+        self.loop = None
+        self.pool = None
+        self.thread = None
+
+    def __enter__(self):
+        get_session(self.per_host)
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.max_connections, initializer=tqdm.set_lock, initargs=(tqdm.get_lock(),))
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            wait(self.futures)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.pool.shutdown()
+        return False
+
+    def submit(self, url, outpath, func, *args, **kwargs):
+        f = asyncio.run_coroutine_threadsafe(
+            self._fetch(url, outpath, partial(func, *args, **kwargs), time.perf_counter()), self.loop)
+        self.futures.append(f)
+        return f
+
+    def limiter(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.limiters:
+            self.limiters[host] = HostLimiter(self.per_host)
+        return self.limiters[host]
+
+    @staticmethod
+    def timing_key(url, outpath):
+        name = basename(outpath)
+        if name.startswith(REPODATA_FN):
+            return url
+        return name
+
+    async def _fetch(self, url, outpath, func, queued):
+        limiter = self.limiter(url)
+        await limiter.acquire()
+        start = time.perf_counter()
+        ok = False
+        try:
+            ret = await self.loop.run_in_executor(self.pool, func)
+            ok = not isinstance(ret, Exception)
+            return ret
+        finally:
+            nbytes = ok and isfile(outpath) and os.path.getsize(outpath) or 0
+            end = time.perf_counter()
+            TIMINGS.record("fetch", start, end, url=url)
+            TIMINGS.package(self.timing_key(url, outpath), bytes=nbytes,
+                            seconds=end - start, wait=start - queued)
+            await limiter.release(ok, nbytes)
+            LOCAL_CONDA_LOG.debug("%s concurrency: %d", urlsplit(url).netloc, limiter.limit)
+
+
+def prefork_pool(max_workers):
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+    # start all workers now, forking once download threads are running may deadlock
+    wait([pool.submit(time.sleep, 0.05) for _ in range(max_workers)])
+    return pool
+
+
+class ExtractPipeline(object):
+
+    def __init__(self, max_workers):
+        self.pool = prefork_pool(max_workers)
+        self.records = []
+        self.errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        with TIMINGS.span("register"):
+            register_package_cache(self.records)
+
+    def add(self, exn, future):
+        future.add_done_callback(partial(self._downloaded, exn))
+
+    def _downloaded(self, exn, future):
+        err = future.exception() or future.result()
+        if err is not None:
+            self.errors.append(err)
+            return
+        try:
+            f = self.pool.submit(DecompressExtract, exn)
+        except Exception as e:
+            self.errors.append(e)
+            return
+        f.add_done_callback(partial(self._extracted, exn))
+
+    def _extracted(self, exn, future):
+        if future.exception() is not None:
+            self.errors.append(future.exception())
+            return
+        record, decompress, extract = future.result()
+        TIMINGS.package(basename(exn.source_full_path),
+                        decompress=decompress, extract=extract)
+        self.records.append((exn.target_pkgs_dir, record))
@@ -0,0 +1,642 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import mmap
+import heapq
+import difflib
+import sqlite3
+
+from glob import glob
+from fnmatch import fnmatchcase
+from os.path import splitext
+from operator import itemgetter
+from itertools import groupby as igroupby
+
+from .utils import *
+
+INDEX_FN = "repodata.sqlite"
+STATS_FN = "repodata.stats.json"
+INDEX_VERSION = "2"
+
+INDEX_SCHEMA = """
+CREATE TABLE info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE packages (
+    fn TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    build TEXT NOT NULL,
+    build_number INTEGER,
+    depends TEXT,
+    size INTEGER,
+    timestamp INTEGER,
+    record TEXT
+);
+CREATE INDEX packages_name ON packages (name);
+CREATE TABLE names (name TEXT PRIMARY KEY);
+CREATE TABLE trigrams (gram TEXT NOT NULL, name TEXT NOT NULL);
+CREATE INDEX trigrams_gram ON trigrams (gram);
+"""
+
+SQL_MAX_PARAMS = 500
+
+DEPENDS_NAME = re.compile(r"\s*(?:[^\s:]+::)?([^\s=<>!~\[,]+)")
+
+
+class LazyRepodata(object):
+
+    sections = ("packages", "packages.conda")
+    _token = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+    _entry = re.compile(rb'\s*"((?:[^"\\]|\\.)*)"\s*:\s*')
+    _sep = re.compile(rb'\s*,?')
+    _size = re.compile(rb'"size"\s*:\s*(\d+)')
+    _timestamp = re.compile(rb'"timestamp"\s*:\s*(\d+)')
+
+    def __init__(self, repofile):
+        self.repofile = repofile
+        self._fi = open(repofile, "rb")
+        if os.path.getsize(repofile):
+            self.mm = mmap.mmap(self._fi.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.mm = b""
+        self.offsets = {}
+        self.info_span = None
+        self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(len(v) for v in self.offsets.values())
+
+    def close(self):
+        if isinstance(self.mm, mmap.mmap):
+            self.mm.close()
+        self._fi.close()
+
+    def _skip(self, pos):
+        depth = 0
+        for m in self._token.finditer(self.mm, pos):
+            c = m.group()[:1]
+            if c in b"{[":
+                depth += 1
+            elif c in b"}]":
+                depth -= 1
+                if depth == 0:
+                    return m.end()
+        raise ValueError("truncated repodata: %s" % self.repofile)
+
+    def _record_end(self, start):
+        mm = self.mm
+        end = mm.find(b"}", start)
+        while end != -1:
+            seg = mm[start:end]
+            if seg.count(b"{") > 1 or b"\\" in seg:
+                return self._skip(start)
+            if seg.count(b'"') % 2 == 0:
+                return end + 1
+            end = mm.find(b"}", end + 1)
+        raise ValueError("truncated repodata: %s" % self.repofile)
+
+    def _scan_section(self, pos, out):
+        while True:
+            m = self._entry.match(self.mm, pos)
+            if not m:
+                return pos
+            fn = m.group(1)
+            fn = json.loads(b'"' + fn + b'"') if b"\\" in fn else fn.decode()
+            end = self._record_end(m.end())
+            out.append((fn, m.end(), end))
+            pos = self._sep.match(self.mm, end).end()
+
+    def _scan(self):
+        depth, key, pos = 0, None, 0
+        while True:
+            m = self._token.search(self.mm, pos)
+            if not m:
+                break
+            t = m.group()
+            pos = m.end()
+            if t[:1] == b'"':
+                if depth == 1:
+                    key = t[1:-1].decode()
+            elif t in b"{[":
+                depth += 1
+                if depth == 2 and t == b"{" and key in self.sections:
+                    pos = self._scan_section(
+                        pos, self.offsets.setdefault(key, []))
+                elif depth == 2 and t == b"{" and key == "info":
+                    pos = self._skip(m.start())
+                    self.info_span = (m.start(), pos)
+                    depth -= 1
+            else:
+                depth -= 1
+        if depth:
+            raise ValueError("truncated repodata: %s" % self.repofile)
+
+    @staticmethod
+    def split_fn(fn):
+        for ext in (".tar.bz2", ".conda"):
+            if fn.endswith(ext):
+                fn = fn[:-len(ext)]
+                break
+        return tuple(fn.rsplit("-", 2))
+
+    def entries(self, name=None):
+        glob = name and any(c in name for c in "*?[")
+        for key in self.sections:
+            for fn, start, end in self.offsets.get(key, ()):
+                if name and name != "*":
+                    n = self.split_fn(fn)[0]
+                    if (glob and not fnmatchcase(n, name)) or (not glob and n != name):
+                        continue
+                yield fn, start, end
+
+    def info(self):
+        if self.info_span is None:
+            return {}
+        return json.loads(self.mm[slice(*self.info_span)])
+
+    def raw(self, name=None):
+        for fn, start, end in self.entries(name):
+            yield fn, self.mm[start:end]
+
+    def records(self, name=None):
+        for fn, raw in self.raw(name):
+            yield fn, json.loads(raw)
+
+    def field(self, regex):
+        for fn, start, end in self.entries():
+            m = regex.search(self.mm, start, end)
+            yield m and int(m.group(1)) or 0
+
+    def sizes(self):
+        return self.field(self._size)
+
+    def timestamps(self):
+        return self.field(self._timestamp)
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def glob_trigrams(pattern):
+    grams = set()
+    for part in re.split(r"[*?]|\[[^\]]*\]", pattern):
+        grams.update(trigrams(part))
+    return grams
+
+
+def chunks(items, size=SQL_MAX_PARAMS):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def index_file(repofile):
+    return join(dirname(repofile), INDEX_FN)
+
+
+def repodata_signature(repofile):
+    st = os.stat(repofile)
+    return "%s:%s" % (st.st_size, st.st_mtime)
+
+
+def index_row(fn, raw):
+    rec = json.loads(raw)
+    return (fn, rec["name"], rec["version"], rec["build"], rec.get("build_number", 0),
+            json.dumps(rec.get("depends", []), separators=(",", ":")), rec.get("size", 0),
+            rec.get("timestamp", 0), raw.decode())
+
+
+def build_index(repofile):
+    outfile = index_file(repofile)
+    tmpfile = outfile + ".part"
+    if isfile(tmpfile):
+        os.remove(tmpfile)
+    signature = repodata_signature(repofile)
+    conn = sqlite3.connect(tmpfile)
+    try:
+        with LazyRepodata(repofile) as repodata:
+            conn.executescript(INDEX_SCHEMA)
+            conn.executemany("INSERT INTO info VALUES (?, ?)", [
+                ("version", INDEX_VERSION),
+                ("source", signature),
+                ("subdir", repodata.info().get(
+                    "subdir", basename(dirname(repofile)))),
+            ])
+            conn.executemany(
+                "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (index_row(fn, raw) for fn, raw in repodata.raw()))
+        names = [n for (n,) in conn.execute("SELECT DISTINCT name FROM packages")]
+        conn.executemany("INSERT INTO names VALUES (?)", ((n,) for n in names))
+        conn.executemany("INSERT INTO trigrams VALUES (?, ?)",
+                         ((g, n) for n in names for g in trigrams(n)))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmpfile, outfile)
+    return outfile
+
+
+def open_index(repofile):
+    dbfile = index_file(repofile)
+    if not isfile(repofile) or not isfile(dbfile):
+        return None
+    conn = sqlite3.connect(dbfile)
+    try:
+        info = dict(conn.execute("SELECT key, value FROM info"))
+    except sqlite3.Error:
+        conn.close()
+        return None
+    if info.get("version") != INDEX_VERSION or info.get("source") != repodata_signature(repofile):
+        conn.close()
+        return None
+    return conn
+
+
+def index_connection(repofile):
+    conn = open_index(repofile)
+    if conn is not None:
+        return conn
+    try:
+        build_index(repofile)
+    except (ValueError, KeyError, OSError, sqlite3.Error) as e:
+        LOCAL_CONDA_LOG.debug("cannot index %s: %s", repofile, e)
+        return None
+    return open_index(repofile)
+
+
+def ensure_index(repofile):
+    conn = open_index(repofile)
+    if conn is None:
+        build_index(repofile)
+    else:
+        conn.close()
+
+
+def stats_file(repofile):
+    return join(dirname(repofile), STATS_FN)
+
+
+def build_stats(repofile, content_hash=None):
+    signature = repodata_signature(repofile)
+    conn = open_index(repofile)
+    if conn is not None:
+        try:
+            count, size, newest = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(MAX(timestamp), 0) FROM packages").fetchone()
+        finally:
+            conn.close()
+    else:
+        with LazyRepodata(repofile) as repodata:
+            count = len(repodata)
+            size = sum(repodata.sizes())
+            newest = max(repodata.timestamps(), default=0)
+    if not content_hash:
+        h = hashlib.blake2b(digest_size=32)
+        update_hash((h,), repofile, 0, os.path.getsize(repofile))
+        content_hash = h.hexdigest()
+    stats = {"source": signature, "packages": count, "size": size,
+             "timestamp": newest, "blake2_256": content_hash}
+    with open(stats_file(repofile), "w") as fo:
+        json.dump(stats, fo, indent=2)
+    return stats
+
+
+def load_stats(repofile):
+    sf = stats_file(repofile)
+    if not isfile(sf):
+        return None
+    try:
+        with open(sf) as fi:
+            stats = json.load(fi)
+    except ValueError:
+        return None
+    if stats.get("source") != repodata_signature(repofile):
+        return None
+    return stats
+
+
+def repodata_stats(repofile):
+    return load_stats(repofile) or build_stats(repofile)
+
+
+def iter_names(repofile):
+    conn = index_connection(repofile)
+    if conn is not None:
+        try:
+            for row in conn.execute("SELECT name, version, build FROM packages ORDER BY name"):
+                yield row
+        finally:
+            conn.close()
+        return
+    try:
+        repodata = LazyRepodata(repofile)
+    except ValueError as e:
+        LOCAL_CONDA_LOG.warning("Skip %s: %s", repofile, e)
+        return
+    with repodata:
+        for row in sorted(repodata.split_fn(fn) for fn, _, _ in repodata.entries()):
+            yield row
+
+
+def iter_packages(repofiles):
+    rows = heapq.merge(*(iter_names(f) for f in repofiles), key=itemgetter(0))
+    for _, group in igroupby(rows, key=itemgetter(0)):
+        for row in sorted(set(group), key=lambda x: (VersionOrder(x[1]), x[2])):
+            yield row
+
+
+def channel_repodata(channel, subdir):
+    if channel.scheme != "file":
+        return None
+    return join(channel.location, channel.name, subdir, REPODATA_FN)
+
+
+def is_glob(name):
+    return any(c in name for c in "*?[")
+
+
+def match_names(conn, name):
+    if not name or name == "*":
+        return None
+    if not is_glob(name):
+        return [name]
+    literal = name[:-1]
+    grams = glob_trigrams(name)
+    if name.endswith("*") and not is_glob(literal) or not grams:
+        rows = conn.execute("SELECT name FROM names WHERE name GLOB ? ORDER BY name", (name,))
+    else:
+        grams = sorted(grams)
+        rows = conn.execute(
+            "SELECT name FROM trigrams WHERE gram IN (%s) GROUP BY name HAVING COUNT(DISTINCT gram) = ? ORDER BY name" % (
+                ", ".join("?" * len(grams))), grams + [len(grams)])
+    return [n for (n,) in rows if fnmatchcase(n, name)]
+
+
+def close_names(conn, name, n=5):
+    grams = sorted(trigrams(name))
+    rows = conn.execute(
+        "SELECT name FROM names WHERE name GLOB ? LIMIT 500", (name[:1] + "*",)).fetchall()
+    if grams:
+        rows += conn.execute(
+            "SELECT name FROM trigrams WHERE gram IN (%s) GROUP BY name ORDER BY COUNT(*) DESC LIMIT 200" % (
+                ", ".join("?" * len(grams))), grams).fetchall()
+    return difflib.get_close_matches(name, {r[0] for r in rows}, n)
+
+
+def index_rows(conn, name=None):
+    names = match_names(conn, name)
+    if names is None:
+        yield from conn.execute("SELECT fn, record FROM packages")
+        return
+    for part in chunks(names):
+        yield from conn.execute("SELECT fn, record FROM packages WHERE name IN (%s)" % (
+            ", ".join("?" * len(part))), part)
+
+
+def index_records(conn, channel, subdir, name=None):
+    url = join(channel.base_url, subdir)
+    ch = Channel(url)
+    for fn, rec in index_rows(conn, name):
+        rec = json.loads(rec)
+        rec.setdefault("subdir", subdir)
+        rec.update(fn=fn, url=join(url, fn), channel=ch)
+        yield PackageRecord(**rec)
+
+
+def lazy_records(repodata, channel, subdir, name=None):
+    url = join(channel.base_url, subdir)
+    ch = Channel(url)
+    for fn, rec in repodata.records(name):
+        rec.setdefault("subdir", subdir)
+        rec.update(fn=fn, url=join(url, fn), channel=ch)
+        yield PackageRecord(**rec)
+
+
+def index_sources(channels, subdirs):
+    sources = []
+    for channel in channels:
+        for subdir in subdirs:
+            repofile = channel_repodata(channel, subdir)
+            if repofile is None:
+                return None
+            if isfile(repofile):
+                sources.append((repofile, channel, subdir))
+    return sources
+
+
+def similar_names(name, channels, subdirs, n=5):
+    names = set()
+    for repofile, _, _ in index_sources(channels, subdirs) or ():
+        conn = open_index(repofile)
+        if conn is None:
+            continue
+        try:
+            names.update(close_names(conn, name, n))
+        finally:
+            conn.close()
+    return difflib.get_close_matches(name, names, n)
+
+
+def stream_index(spec, channels, subdirs):
+    sources = index_sources(channels, subdirs)
+    if not sources:
+        return None
+    conns = []
+    for repofile, _, _ in sources:
+        conn = index_connection(repofile)
+        if conn is None:
+            for c in conns:
+                c.close()
+            return None
+        conns.append(conn)
+    return _stream_index(spec, sources, conns)
+
+
+def _stream_index(spec, sources, conns):
+    name = spec.get_raw_value("name")
+    try:
+        names = []
+        for conn in conns:
+            matched = match_names(conn, name)
+            if matched is None:
+                names.append(n for (n,) in conn.execute(
+                    "SELECT name FROM names ORDER BY name"))
+            else:
+                names.append(iter(matched))
+        for n, _ in igroupby(heapq.merge(*names)):
+            records = []
+            for conn, (_, channel, subdir) in zip(conns, sources):
+                records.extend(rec for rec in index_records(
+                    conn, channel, subdir, n) if spec.match(rec))
+            if records:
+                yield records
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def source_rows(repofile, name=None):
+    conn = open_index(repofile)
+    if conn is not None:
+        try:
+            for fn, rec in index_rows(conn, name):
+                yield fn, json.loads(rec)
+        finally:
+            conn.close()
+        return
+    with LazyRepodata(repofile) as repodata:
+        yield from repodata.records(name)
+
+
+def match_source(spec, repofile, base_url, subdir):
+    spec = MatchSpec(spec)
+    url = join(base_url, subdir)
+    ch = Channel(url)
+    matches = []
+    for fn, rec in source_rows(repofile, spec.get_raw_value("name")):
+        rec.setdefault("subdir", subdir)
+        rec.update(fn=fn, url=join(url, fn))
+        if spec.match(PackageRecord(channel=ch, **rec)):
+            matches.append(rec)
+    return matches
+
+
+def source_stats(repofile):
+    try:
+        return repodata_stats(repofile)
+    except ValueError:
+        return None
+
+
+def query_index(spec, channels, subdirs, jobs=1):
+    sources = index_sources(channels, subdirs)
+    if sources is None:
+        return None
+    name = spec.get_raw_value("name")
+    results, lazy = {}, []
+    for repofile, channel, subdir in sources:
+        conn = open_index(repofile)
+        if conn is None:
+            lazy.append((repofile, channel, subdir))
+            continue
+        try:
+            results[repofile] = [rec for rec in index_records(
+                conn, channel, subdir, name) if spec.match(rec)]
+        finally:
+            conn.close()
+    if jobs > 1 and len(lazy) > 1:
+        args = [(str(spec), repofile, channel.base_url, subdir)
+                for repofile, channel, subdir in lazy]
+        with ProcessPoolExecutor(min(jobs, len(lazy))) as pool:
+            for (repofile, channel, subdir), recs in zip(lazy, pool.map(match_source, *zip(*args))):
+                ch = Channel(join(channel.base_url, subdir))
+                results[repofile] = [PackageRecord(channel=ch, **rec) for rec in recs]
+    else:
+        for repofile, channel, subdir in lazy:
+            with LazyRepodata(repofile) as repodata:
+                results[repofile] = [rec for rec in lazy_records(
+                    repodata, channel, subdir, name) if spec.match(rec)]
+    return [rec for repofile, _, _ in sources for rec in results[repofile]]
+
+
+def dependency_closure(conns, names):
+    closure, todo = set(), set(names)
+    while todo:
+        closure.update(todo)
+        found = set()
+        for conn in conns:
+            for part in chunks(sorted(todo)):
+                for (depends,) in conn.execute("SELECT depends FROM packages WHERE name IN (%s)" % (
+                        ", ".join("?" * len(part))), part):
+                    for dep in json.loads(depends or "[]"):
+                        m = DEPENDS_NAME.match(dep)
+                        if m:
+                            found.add(m.group(1))
+        todo = found - closure
+    return closure
+
+
+def write_pruned(conn, subdir, names, outfile):
+    repodata = {"info": {"subdir": subdir}, "packages": {},
+                "packages.conda": {}, "repodata_version": 1}
+    for part in chunks(sorted(names)):
+        for fn, rec in conn.execute("SELECT fn, record FROM packages WHERE name IN (%s)" % (
+                ", ".join("?" * len(part))), part):
+            key = fn.endswith(".conda") and "packages.conda" or "packages"
+            repodata[key][fn] = json.loads(rec)
+    mkdir(dirname(outfile))
+    with open(outfile, "w") as fo:
+        json.dump(repodata, fo, separators=(",", ":"))
+
+
+def pruned_cache_files(root):
+    from conda.core.subdir_data import cache_fn_url, create_cache_dir
+    cache_dir = create_cache_dir()
+    files = []
+    for i in os.listdir(root):
+        for name in os.listdir(join(root, i)):
+            chdir = join(root, i, name)
+            for subdir in set(os.listdir(chdir)) | set(context.subdirs):
+                base = splitext(cache_fn_url(path_to_url(join(chdir, subdir))))[0]
+                files.extend(glob(join(cache_dir, base + ".*")))
+    return files
+
+
+def evict_pruned(outdir, size=DEFAULT_PRUNED_SIZE):
+    dirs = [join(outdir, d) for d in os.listdir(outdir)
+            if not d.endswith(".part") and isdir(join(outdir, d))]
+    dirs.sort(key=os.path.getmtime)
+    for d in dirs[:max(0, len(dirs) - size)]:
+        try:
+            for f in pruned_cache_files(d):
+                rm_rf(f)
+        except Exception as e:
+            LOCAL_CONDA_LOG.debug("cannot clean repodata cache of %s: %s", d, e)
+        rm_rf(d)
+
+
+def prune_channels(channels, subdirs, names, outdir=join(LOCAL_CONDA_DIR, PRUNED_DIR)):
+    channels = list(channels)
+    sources = index_sources(channels, subdirs)
+    if not sources:
+        return None
+    conns = []
+    try:
+        for repofile, _, _ in sources:
+            ensure_index(repofile)
+            conn = open_index(repofile)
+            if conn is None:
+                return None
+            conns.append(conn)
+        closure = dependency_closure(conns, names)
+        digest = hashlib.sha256(json.dumps([sorted(closure), [
+            (f, repodata_signature(f)) for f, _, _ in sources]]).encode()).hexdigest()[:16]
+        root = join(outdir, digest)
+        pruned, channel_map = [], {}
+        for i, channel in enumerate(channels):
+            ch = Channel(scheme="file", location=join(
+                root, str(i)), name=channel.name)
+            pruned.append(ch)
+            channel_map[ch.base_url] = channel
+        if isdir(root):
+            os.utime(root)
+            return pruned, channel_map
+        tmpdir = "%s.%d.part" % (root, os.getpid())
+        for (repofile, channel, subdir), conn in zip(sources, conns):
+            write_pruned(conn, subdir, closure, join(
+                tmpdir, str(channels.index(channel)), channel.name, subdir, REPODATA_FN))
+        try:
+            os.rename(tmpdir, root)
+        except OSError:
+            rm_rf(tmpdir)
+        evict_pruned(outdir)
+        return pruned, channel_map
+    finally:
+        for conn in conns:
+            conn.close()
@@ -1,48 +1,110 @@
 #!/usr/bin/env python
 # coding:utf-8
 
-from .src import *
-from .cli import *
+import os
+import sys
+import time
 
+from importlib import import_module
 
-def create_parser():
+from ._version import __version__
+from .daemon import daemon_call
+from .registry import cached_channel_names, show_channel_names
+from .timings import TIMINGS
+from .cli import COMMANDS, configure_command, find_command
+
+
+def create_parser(argv=None):
+    from .src import localArgumentParser, show_help_on_empty_command, add_version
+    show_help_on_empty_command()
+    if argv is None:
+        argv = sys.argv[1:]
+    cmd = find_command(argv)
+    if cmd not in dict(COMMANDS):
+        cmd = None
     p = localArgumentParser()
     sub_parsers = p.add_subparsers(
         metavar='command',
         dest='cmd',
     )
-    main_install.configure_parser(sub_parsers)
-    main_create.configure_parser(sub_parsers)
-    main_update.configure_parser(sub_parsers)
-    main_remove.configure_parser(sub_parsers)
-    main_search.configure_parser(sub_parsers)
-    main_download.configure_parser(sub_parsers)
-    main_cache.configure_parser(sub_parsers)
-    main_list.configure_parser(sub_parsers)
-    main_list.configure_parser(sub_parsers, name="ls")
-    show_help_on_empty_command()
+    for name, module in COMMANDS:
+        if cmd is None or cmd == name:
+            configure_command(sub_parsers, name, module)
+        else:
+            sub_parsers.add_parser(name)
     add_version(p)
     return p
 
 
 def do_call(args):
+    from .src import ForceExitDaemon
     relative_mod, func_name = args.func.rsplit('.', 1)
     module = import_module(relative_mod, __package__)
     ForceExitDaemon().start()
-    return getattr(module, func_name)(args)
+    with TIMINGS.span(args.cmd):
+        return getattr(module, func_name)(args)
+
+
+def list_channel_names(argv):
+    if len(argv) != 2 or argv[0] not in ("list", "ls") or argv[1] != "--only-channel-name":
+        return None
+    names = cached_channel_names()
+    if names is None:
+        return None
+    show_channel_names(names)
+    return 0
 
 
 def main():
+    started = time.perf_counter()
+    if sys.argv[1:] in (["-v"], ["--version"]):
+        print("v" + __version__)
+        return 0
+    code = list_channel_names(sys.argv[1:])
+    if code is not None:
+        return code
+    code = daemon_call(sys.argv[1:])
+    if code is not None:
+        return code
     parser = create_parser()
     args = parser.parse_args()
+    return run(args, started)
+
+
+def run(args, started=None):
+    profile = getattr(args, "profile", None)
+    if getattr(args, "timings", False) or profile:
+        TIMINGS.enable(started)
+        if started:
+            TIMINGS.record("startup", started, time.perf_counter())
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return _run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            TIMINGS.dump(profile + ".json")
+        if getattr(args, "timings", False):
+            TIMINGS.summary()
+        TIMINGS.disable()
+
+
+def _run(args):
+    from .src import context, init_loggers, getLogger, LOCAL_CONDA_LOG, conda_exception_handler
     if getattr(args, "debug", None):
         LOCAL_CONDA_LOG.setLevel(10)
     os.environ["CONDA_AUTO_UPDATE_CONDA"] = "false"
-    context.__init__(argparse_args=args)
-    try:
-        init_loggers(context)
-    except TypeError:
-        init_loggers()
+    with TIMINGS.span("context"):
+        context.__init__(argparse_args=args)
+        try:
+            init_loggers(context)
+        except TypeError:
+            init_loggers()
     stdoutlog = getLogger("conda.stdoutlog")
     for h in stdoutlog.handlers:
         stdoutlog.removeHandler(h)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import os
+import json
+
+from os.path import join, dirname, isfile
+
+LOCAL_CONDA_DIR = os.getenv("LOCAL_CONDA_DIR", "") or join(
+    os.environ["HOME"], ".conda")
+REGISTRY_FN = ".registry.json"
+REPODATA_FN = "repodata.json"
+
+
+def read_registry(rd=LOCAL_CONDA_DIR):
+    try:
+        with open(join(rd, REGISTRY_FN)) as fi:
+            registry = json.load(fi)
+    except (OSError, ValueError):
+        return None
+    for f, info in registry.get("url_files", {}).items():
+        if not isfile(f) or os.path.getmtime(f) != info["mtime"]:
+            return None
+    return registry
+
+
+def cached_channel_names(rd=LOCAL_CONDA_DIR):
+    registry = read_registry(rd)
+    if registry is None or not registry.get("subdir"):
+        return None
+    subdir = os.getenv("CONDA_SUBDIR") or registry["subdir"]
+    names = set()
+    for f, info in registry["url_files"].items():
+        for name in info["channels"]:
+            if isfile(join(dirname(f), name, subdir, REPODATA_FN)):
+                names.add(name)
+    return names
+
+
+def show_channel_names(names):
+    print("all local cached channels:")
+    for cn in sorted(names):
+        print("  - {}".format(cn))
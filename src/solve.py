@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import pickle
+
+from functools import lru_cache
+
+from .utils import *
+from .index import *
+
+from conda.core.solve import Solver
+from conda.core.link import PrefixSetup, UnlinkLinkTransaction
+
+
+class _localSolver(Solver):
+
+    def solve_for_transaction(self, update_modifier=NULL, deps_modifier=NULL, prune=NULL,
+                              ignore_pinned=NULL, force_remove=NULL, force_reinstall=NULL,
+                              should_retry_solve=False):
+        if self.prefix == context.root_prefix and context.enable_private_envs:
+            raise NotImplementedError()
+        else:
+            cache = getattr(self, "solve_cache", None)
+            key = cache is not None and solve_key(
+                self, update_modifier, deps_modifier, prune, ignore_pinned,
+                force_remove, force_reinstall) or None
+            cached = key and cache.get(key)
+            if cached:
+                unlink_precs, link_precs, self.neutered_specs = cached
+            else:
+                unlink_precs, link_precs = self.solve_for_diff(update_modifier, deps_modifier,
+                                                               prune, ignore_pinned,
+                                                               force_remove, force_reinstall,
+                                                               should_retry_solve)
+                link_precs = restore_channels(
+                    link_precs, getattr(self, "channel_map", None))
+                if key:
+                    cache.put(key, (unlink_precs, link_precs,
+                                    self.neutered_specs))
+            stp = PrefixSetup(self.prefix, unlink_precs, link_precs,
+                              self.specs_to_remove, self.specs_to_add, self.neutered_specs)
+            return localUnlinkLinkTransaction(stp)
+
+
+class localUnlinkLinkTransaction(UnlinkLinkTransaction):
+
+    def print_transaction_summary(self, only_download=False):
+        legacy_action_groups = self._make_legacy_action_groups()
+        download_urls = set(axn.url for axn in self._pfe.cache_actions)
+        for actions, (prefix, stp) in zip(legacy_action_groups, self.prefix_setups.items()):
+            change_report = self._calculate_change_report(prefix, stp.unlink_precs, stp.link_precs,
+                                                          download_urls, stp.remove_specs,
+                                                          stp.update_specs)
+            change_report_str = self._change_report_str(change_report)
+            if not only_download:
+                print(ensure_text_type(change_report_str))
+            else:
+                total_size = human_bytes(
+                    sum(i.size for i in legacy_action_groups[0]["LINK"]))
+                report_download_str = [
+                    "\n## Package Plan ##\n  \n  download specs:"]
+                for s in sorted(str(i) for i in change_report.specs_to_add):
+                    report_download_str.append("    - %s" % s)
+                change_report_list = change_report_str.split("\n")
+                report_str_index = change_report_list.index(
+                    "The following NEW packages will be INSTALLED:")
+                report_download_str.append(
+                    "\nThe following packages will be downloaded (%s):\n" % total_size)
+                end = False
+                for line in change_report_list[report_str_index+1:]:
+                    if line.strip():
+                        report_download_str.append(line.strip("\n"))
+                        end = True
+                    else:
+                        if end:
+                            break
+                print("\n".join(report_download_str) + "\n\n")
+        return legacy_action_groups
+
+
+class SolveCache(Log):
+
+    def __init__(self, path=join(LOCAL_CONDA_DIR, SOLVE_CACHE_DIR), size=DEFAULT_SOLVE_CACHE_SIZE):
+        self.path = path
+        self.size = size
+
+    def file(self, key):
+        return join(self.path, key + ".pkl")
+
+    def get(self, key):
+        f = self.file(key)
+        if not isfile(f):
+            return None
+        try:
+            with open(f, "rb") as fi:
+                value = pickle.load(fi)
+        except Exception as e:
+            self.log.debug("drop unreadable solve cache %s: %s", f, e)
+            os.remove(f)
+            return None
+        os.utime(f)
+        self.log.debug("reuse cached solution %s", f)
+        return value
+
+    def put(self, key, value):
+        mkdir(self.path)
+        f = self.file(key)
+        tmpfile = f + ".part"
+        try:
+            with open(tmpfile, "wb") as fo:
+                pickle.dump(value, fo, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            self.log.debug("cannot cache solution %s: %s", f, e)
+            if isfile(tmpfile):
+                os.remove(tmpfile)
+            return
+        os.replace(tmpfile, f)
+        self.evict()
+
+    def evict(self):
+        files = [join(self.path, f)
+                 for f in os.listdir(self.path) if f.endswith(".pkl")]
+        if len(files) <= self.size:
+            return
+        files.sort(key=os.path.getmtime)
+        for f in files[:len(files) - self.size]:
+            os.remove(f)
+
+
+def restore_channels(precs, channel_map):
+    if not channel_map:
+        return precs
+    restored = []
+    for prec in precs:
+        base_url = prec.channel.base_url
+        channel = channel_map.get(base_url)
+        if channel is None:
+            restored.append(prec)
+        else:
+            restored.append(PackageRecord.from_objects(
+                prec, channel=channel, url=prec.url.replace(base_url, channel.base_url, 1)))
+    return type(precs)(restored)
+
+
+def virtual_packages():
+    overrides = tuple(sorted((k, v) for k, v in os.environ.items()
+                             if k.startswith("CONDA_OVERRIDE_")))
+    return _virtual_packages(context.subdir, overrides)
+
+
+@lru_cache(maxsize=None)
+def _virtual_packages(subdir, overrides):
+    plugin_manager = getattr(context, "plugin_manager", None)
+    if plugin_manager is not None:
+        records = plugin_manager.get_virtual_package_records()
+    else:
+        from conda.core.index import _supplement_index_with_system
+        records = {}
+        _supplement_index_with_system(records)
+    return tuple(sorted("%s=%s=%s" % (rec.name, rec.version, rec.build) for rec in records))
+
+
+def solve_key(solver, *modifiers):
+    channels = getattr(solver, "source_channels", solver.channels)
+    sources = []
+    for channel in channels:
+        for subdir in solver.subdirs:
+            repofile = channel_repodata(channel, subdir)
+            if repofile is None:
+                return None
+            if not isfile(repofile):
+                continue
+            stats = load_stats(repofile)
+            sources.append((channel.base_url, subdir, stats and stats.get(
+                "blake2_256") or repodata_signature(repofile)))
+    prefix, installed, pinned = None, [], ""
+    if solver.prefix and isdir(solver.prefix):
+        prefix = solver.prefix
+        installed = sorted(rec.dist_str()
+                           for rec in PrefixData(solver.prefix).iter_records())
+        pinned_file = join(solver.prefix, "conda-meta", "pinned")
+        if isfile(pinned_file):
+            with open(pinned_file) as fi:
+                pinned = fi.read()
+    key = {
+        "solver": "%s.%s" % (type(solver).__module__, type(solver).__name__),
+        "specs_to_add": sorted(str(s) for s in solver.specs_to_add),
+        "specs_to_remove": sorted(str(s) for s in solver.specs_to_remove),
+        "channels": [c.base_url for c in channels],
+        "subdirs": list(solver.subdirs),
+        "repodata": sources,
+        "prefix": prefix,
+        "installed": installed,
+        "pinned": [list(context.pinned_packages), pinned],
+        "modifiers": [str(m) for m in modifiers],
+        "channel_priority": str(context.channel_priority),
+        "track_features": list(context.track_features),
+        "virtual_packages": virtual_packages(),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_local_solver_class(key=None):
+    key = get_solver_key(key=key)
+    if key == "classic":
+        return _localSolver
+    elif key.startswith("libmamba"):
+        from conda_libmamba_solver import get_solver_class
+        solver = get_solver_class(key)
+        solver.solve_for_transaction = _localSolver.solve_for_transaction
+        solver._print_info = lambda _: print()
+        return solver
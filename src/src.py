@@ -68,8 +68,7 @@ class LocalChannels(object):
 
 class LocalCondaRepo(Log):
 
-    defaut_repo_dir = os.getenv("LOCAL_CONDA_DIR", "") or join(
-        os.environ["HOME"], ".conda")
+    defaut_repo_dir = LOCAL_CONDA_DIR
     repodata_fn = REPODATA_FN
 
     def __init__(self, repo=None):
@@ -80,26 +79,84 @@ class LocalCondaRepo(Log):
         self.url_files = set()
         self.channels = {}
         self.channels_url = {}
+        self.channels_mirrors = {}
         # self._url_to_name = {}
 
+    @TIMINGS.timed("scan_repos")
     def scan_repos(self):
         for rd in self._repodir:
             if isdir(rd):
-                for a, b, c in os.walk(rd, followlinks=True):
-                    for i in c:
-                        if basename(i) == self.repodata_fn:
-                            self.repos.append(join(a, i))
-                        elif basename(i) == ".urls.json":
-                            f = join(a, i)
-                            self.url_files.add(f)
-                            with open(f) as fi:
-                                for name, url in json.load(fi)["channels"].items():
-                                    if isfile(join(a, name, context.subdir, REPODATA_FN)):
-                                        c = LocalChannels.from_url(url)
-                                        self.channels[name] = c.to_channel(
-                                            name=name)
-                                        self.channels_url[name] = dirname(
-                                            c.url)
+                registry = self.load_registry(rd)
+                if registry is None:
+                    registry = {"url_files": {}}
+                    for a, b, c in os.walk(rd, followlinks=True):
+                        for i in c:
+                            if basename(i) == ".urls.json":
+                                self._register(registry, join(a, i))
+                    self.save_registry(rd, registry)
+                for f, info in registry["url_files"].items():
+                    self.url_files.add(f)
+                    for name, ch in info["channels"].items():
+                        repofile = join(dirname(f), name,
+                                        context.subdir, REPODATA_FN)
+                        if isfile(repofile):
+                            self.repos.append(repofile)
+                            c = LocalChannels(
+                                ch["scheme"], ch["location"], ch["name"], ch["url"])
+                            c.local_url = ch["local_url"]
+                            self.channels[name] = c.to_channel(name=name)
+                            self.channels_url[name] = dirname(c.url)
+                            self.channels_mirrors.setdefault(
+                                name, []).append(dirname(c.url))
+
+    def load_registry(self, rd):
+        registry_file = join(rd, REGISTRY_FN)
+        if not isfile(registry_file):
+            return None
+        try:
+            with open(registry_file) as fi:
+                registry = json.load(fi)
+        except ValueError:
+            return None
+        changed = registry.get("subdir") != context.subdir
+        for f, info in list(registry["url_files"].items()):
+            if not isfile(f):
+                return None
+            if os.path.getmtime(f) != info["mtime"]:
+                self._register(registry, f)
+                changed = True
+        if changed:
+            self.save_registry(rd, registry)
+        return registry
+
+    @staticmethod
+    def save_registry(rd, registry):
+        registry["subdir"] = context.subdir
+        registry["time_stmp"] = int(time.time())
+        tmpfile = join(rd, REGISTRY_FN + ".part")
+        with open(tmpfile, "w") as fo:
+            json.dump(registry, fo, indent=2)
+        os.replace(tmpfile, join(rd, REGISTRY_FN))
+
+    @staticmethod
+    def _register(registry, url_file):
+        channels = {}
+        with open(url_file) as fi:
+            for name, url in json.load(fi)["channels"].items():
+                c = LocalChannels.from_url(url)
+                channels[name] = {"scheme": c.scheme, "location": c.location,
+                                  "name": c.name, "url": c.url, "local_url": c.local_url}
+        registry["url_files"][url_file] = {
+            "mtime": os.path.getmtime(url_file), "channels": channels}
+
+    def update_registry(self, url_files):
+        rd = self.defaut_repo_dir
+        registry = self.load_registry(rd)
+        if registry is None:
+            return self.scan_repos()
+        for f in url_files:
+            self._register(registry, f)
+        self.save_registry(rd, registry)
 
     parse_repos = scan_repos
 
@@ -115,6 +172,8 @@ class LocalConda(Log):
         self.lock = Lock()
         self.pip_pkgs = []
         self.channels = list(context.channels)
+        self.alternates = {}
+        self._mirrors = {}
 
     def _get_spec(self):
         args_packages = []
@@ -147,15 +206,43 @@ class LocalConda(Log):
         self.pip_pkgs.extend(env.dependencies.get("pip", []))
         return env.dependencies["conda"]
 
+    @TIMINGS.timed("get_solve")
     def _get_solve(self):
         self.local_repo.parse_repos()
         channel_names = new_channel_names(self.channels, self.args)
         channels = self.local_channels(channel_names, self.local_repo)
         log_channel_used(channels)
-        solver = localSolver(key=self.args.solver)(self.prefix, channels,
+        solve_channels, channel_map = channels, {}
+        if not getattr(self.args, "no_prune", False):
+            with TIMINGS.span("prune"):
+                solve_channels, channel_map = self.prune_channels(
+                    channels) or (channels, {})
+        solver = localSolver(key=self.args.solver)(self.prefix, solve_channels,
                                                    context.subdirs, specs_to_add=self.specs)
+        solver.source_channels = channels
+        solver.channel_map = channel_map
+        if not getattr(self.args, "no_solve_cache", False):
+            from .solve import SolveCache
+            solver.solve_cache = SolveCache()
         return solver
 
+    def prune_channels(self, channels):
+        names = {"pip"}
+        for spec in map(MatchSpec, list(self.specs) + list(context.pinned_packages)):
+            name = spec.get_exact_value("name")
+            if not name:
+                return None
+            names.add(name)
+        if self.prefix and isdir(self.prefix):
+            names.update(
+                rec.name for rec in PrefixData(self.prefix).iter_records())
+        try:
+            from .index import prune_channels
+            return prune_channels(channels, context.subdirs, names)
+        except Exception as e:
+            self.log.debug("prune channels failed: %s", e)
+            return None
+
     @staticmethod
     def local_channels(chl_names, local_repo, local=True):
         channels = IndexedSet()
@@ -193,20 +280,21 @@ class LocalConda(Log):
         update_modifier = UpdateModifier.FREEZE_INSTALLED
         if cmd == "update":
             update_modifier = context.update_modifier
-        try:
-            unlink_link_transaction = self.solver.solve_for_transaction(
-                deps_modifier=context.deps_modifier,
-                force_reinstall=self.args.force_reinstall,
-                update_modifier=update_modifier)
-        except (UnsatisfiableError, SystemExit):
-            unlink_link_transaction = self.solver.solve_for_transaction(
-                update_modifier=NULL)
-        except (ResolvePackageNotFound, PackagesNotFoundError) as e:
-            if isinstance(e, PackagesNotFoundError):
-                raise e
-            channel_urls = [c.base_url if not c.base_url.startswith(
-                "file://") else c.base_url[7:] for c in self.solver.channels]
-            raise PackagesNotFoundError(e._formatted_chains, channel_urls)
+        with TIMINGS.span("solve_for_transaction"):
+            try:
+                unlink_link_transaction = self.solver.solve_for_transaction(
+                    deps_modifier=context.deps_modifier,
+                    force_reinstall=self.args.force_reinstall,
+                    update_modifier=update_modifier)
+            except (UnsatisfiableError, SystemExit):
+                unlink_link_transaction = self.solver.solve_for_transaction(
+                    update_modifier=NULL)
+            except (ResolvePackageNotFound, PackagesNotFoundError) as e:
+                if isinstance(e, PackagesNotFoundError):
+                    raise e
+                channel_urls = [c.base_url if not c.base_url.startswith(
+                    "file://") else c.base_url[7:] for c in self.solver.source_channels]
+                raise PackagesNotFoundError(e._formatted_chains, channel_urls)
         if unlink_link_transaction.nothing_to_do:
             print('\n# All requested packages already installed.\n')
             return
@@ -220,44 +308,78 @@ class LocalConda(Log):
         if context.download_only:
             mkdir(self.download_dir)
             print("\nDownload Packages")
-            with ThreadPoolExecutor(max_workers=min(len(all_links[0]["LINK"]), DEFAULT_THREADS)) as p:
+            tqdm.set_lock(RLock())
+            with self.download_engine() as p:
                 for pkgs in all_links[0]["LINK"]:
                     url = self.back_url(pkgs)
                     outpath = join(self.download_dir, basename(url))
-                    p.submit(Download.download_file,
-                             url, outpath, md5=pkgs.md5)
+                    p.submit(url, outpath, Download.download_file,
+                             url, outpath, md5=pkgs.md5,
+                             segments=getattr(self.args, "segments", DEFAULT_SEGMENTS))
             print()
             self.log.info(
                 "All packages and depency saved in '%s' directory.", self.download_dir)
             return
         self.multi_download_extract(unlink_link_transaction)
-        unlink_link_transaction.execute()
-        self.install_pip()
+        with TIMINGS.span("execute"):
+            unlink_link_transaction.execute()
+        with TIMINGS.span("install_pip"):
+            self.install_pip()
 
     def multi_download_extract(self, txn):
+        from .engine import ExtractPipeline
         if len(txn._pfe.cache_actions):
             n_multi = min(len(txn._pfe.cache_actions), DEFAULT_THREADS)
             print("\nDownload Packages")
             tqdm.set_lock(RLock())
-            with ThreadPoolExecutor(initializer=tqdm.set_lock, initargs=(tqdm.get_lock(),), max_workers=n_multi) as p:
-                for axn, exn in zip(txn._pfe.cache_actions, txn._pfe.extract_actions):
-                    download = Download(axn, exn, self.lock)
-                    p.submit(download.run)
-            with Spinner("\nExtract Packages", fail_message="failed\n"):
-                with ProcessPoolExecutor(max_workers=n_multi) as p:
-                    p.map(Decompress, txn._pfe.extract_actions)
-                for exn in txn._pfe.extract_actions:
-                    estract = Extract(exn)
-                    estract.run()
+            hedge = getattr(self.args, "hedge", False) and HedgePolicy()
+            pipeline = ExtractPipeline(n_multi)
+            try:
+                with TIMINGS.span("download"), self.download_engine() as p:
+                    for axn, exn in zip(txn._pfe.cache_actions, txn._pfe.extract_actions):
+                        download = Download(
+                            axn, exn, self.lock, self.alternates.get(axn.url, ()),
+                            segments=getattr(
+                                self.args, "segments", DEFAULT_SEGMENTS),
+                            multi_mirror=getattr(
+                                self.args, "multi_mirror", False),
+                            hedge=hedge)
+                        pipeline.add(exn, p.submit(
+                            axn.url, axn.target_full_path, download.run))
+                if self.alternates:
+                    get_mirror_scores().save()
+            finally:
+                with TIMINGS.span("extract"), Spinner("\nExtract Packages", fail_message="failed\n"):
+                    pipeline.close()
+            if pipeline.errors:
+                raise pipeline.errors[0]
         txn._pfe._executed = True
 
+    def download_engine(self):
+        from .engine import DownloadEngine
+        return DownloadEngine(
+            getattr(self.args, "max_connections", DEFAULT_MAX_CONNECTIONS),
+            getattr(self.args, "per_host", DEFAULT_PER_HOST))
+
     def back_url(self, axn):
         c = Channel.from_url(axn.url)
         if c.name in self.local_repo.channels_url and c.base_url in axn.url:
-            axn.url = axn.url.replace(
-                c.base_url, self.local_repo.channels_url[c.name])
+            urls = [axn.url.replace(c.base_url, m)
+                    for m in self.channel_mirrors(c.name)]
+            axn.url = urls[0]
+            self.alternates[axn.url] = urls[1:]
         return axn.url
 
+    def channel_mirrors(self, name):
+        if name not in self._mirrors:
+            mirrors = self.local_repo.channels_mirrors.get(name, [])
+            if len(set(mirrors)) > 1:
+                mirrors = fast_url(set(mirrors), suffix=join(
+                    "noarch", REPODATA_FN))
+            self._mirrors[name] = list(
+                mirrors) or [self.local_repo.channels_url[name]]
+        return self._mirrors[name]
+
     def install_pip(self):
         if self.pip_pkgs and not self.args.ignore_pip:
             with Spinner("\nInstalling pip dependencies:", fail_message="failed\n"):
@@ -340,59 +462,6 @@ def conda_exception_handler(func, *args, **kwargs):
     return return_value
 
 
-class _localSolver(Solver):
-
-    def solve_for_transaction(self, update_modifier=NULL, deps_modifier=NULL, prune=NULL,
-                              ignore_pinned=NULL, force_remove=NULL, force_reinstall=NULL,
-                              should_retry_solve=False):
-        if self.prefix == context.root_prefix and context.enable_private_envs:
-            raise NotImplementedError()
-        else:
-            unlink_precs, link_precs = self.solve_for_diff(update_modifier, deps_modifier,
-                                                           prune, ignore_pinned,
-                                                           force_remove, force_reinstall,
-                                                           should_retry_solve)
-            stp = PrefixSetup(self.prefix, unlink_precs, link_precs,
-                              self.specs_to_remove, self.specs_to_add, self.neutered_specs)
-            return localUnlinkLinkTransaction(stp)
-
-
-class localUnlinkLinkTransaction(UnlinkLinkTransaction):
-
-    def print_transaction_summary(self, only_download=False):
-        legacy_action_groups = self._make_legacy_action_groups()
-        download_urls = set(axn.url for axn in self._pfe.cache_actions)
-        for actions, (prefix, stp) in zip(legacy_action_groups, self.prefix_setups.items()):
-            change_report = self._calculate_change_report(prefix, stp.unlink_precs, stp.link_precs,
-                                                          download_urls, stp.remove_specs,
-                                                          stp.update_specs)
-            change_report_str = self._change_report_str(change_report)
-            if not only_download:
-                print(ensure_text_type(change_report_str))
-            else:
-                total_size = human_bytes(
-                    sum(i.size for i in legacy_action_groups[0]["LINK"]))
-                report_download_str = [
-                    "\n## Package Plan ##\n  \n  download specs:"]
-                for s in sorted(str(i) for i in change_report.specs_to_add):
-                    report_download_str.append("    - %s" % s)
-                change_report_list = change_report_str.split("\n")
-                report_str_index = change_report_list.index(
-                    "The following NEW packages will be INSTALLED:")
-                report_download_str.append(
-                    "\nThe following packages will be downloaded (%s):\n" % total_size)
-                end = False
-                for line in change_report_list[report_str_index+1:]:
-                    if line.strip():
-                        report_download_str.append(line.strip("\n"))
-                        end = True
-                    else:
-                        if end:
-                            break
-                print("\n".join(report_download_str) + "\n\n")
-        return legacy_action_groups
-
-
 def check_prefix(prefix, json=False):
     name = basename(prefix)
     error = None
@@ -426,40 +495,73 @@ def print_activate(env_name_or_prefix):
 
 
 def get_local_solver_class(key=None):
-    key = get_solver_key(key=key)
-    if key == "classic":
-        return _localSolver
-    elif key.startswith("libmamba"):
-        from conda_libmamba_solver import get_solver_class
-        solver = get_solver_class(key)
-        solver.solve_for_transaction = _localSolver.solve_for_transaction
-        solver._print_info = lambda _: print()
-        return solver
-
-
-def get_repo_channels(mirrors):
+    from .solve import get_local_solver_class
+    return get_local_solver_class(key)
+
+
+def get_repo_channels(mirrors, threads=DEFAULT_THREADS, ttl=0):
+    return sorted(iter_repo_channels(mirrors, threads=threads, ttl=ttl),
+                  key=lambda c: c.name)
+
+
+def iter_repo_channels(mirrors, threads=DEFAULT_THREADS, ttl=0):
+    n = urlsplit(mirrors)
+    list_file = join(LocalCondaRepo.defaut_repo_dir,
+                     n.netloc, n.path.strip("/"), MIRROR_LIST_FN)
+    if ttl > 0 and isfile(list_file):
+        with open(list_file) as fi:
+            info = json.load(fi)
+        if time.time() - info["time_stmp"] < ttl:
+            LOCAL_CONDA_LOG.debug("use cached channels list of %s", mirrors)
+            for c in info["channels"]:
+                yield _mirror_channel(info["url"], c)
+            return
+    chnames = []
+    for url, c in _find_repo_channels(mirrors, threads):
+        chnames.append(c)
+        yield _mirror_channel(url, c)
+        mirrors = url
+    if not chnames:
+        return
+    mkdir(dirname(list_file))
+    with open(list_file, "w") as fo:
+        json.dump({"url": mirrors, "channels": sorted(chnames),
+                   "time_stmp": int(time.time())}, fo, indent=2)
+
+
+def _mirror_channel(mirrors, name):
+    url = join(mirrors, name, context.subdirs[0], REPODATA_FN)
+    channel = LocalChannels.from_url(url)
+    return channel.to_channel(local=False, name=name)
+
+
+def _find_repo_channels(mirrors, threads=DEFAULT_THREADS):
     headers = default_headers
-    res = requests.get(url=mirrors, headers=headers)
+    session = get_session(threads)
+    res = session.get(url=mirrors, headers=headers)
+    res.raise_for_status()
     mirrors = res.url
     h = etree.HTML(res.content)
-    channels = []
     chnames = [i.strip("/") for i in h.xpath("//a/@href")
                if re.match("^\w", i) and i.endswith("/")]
-    for c in sorted(chnames):
+
+    def is_channel(c):
         url = join(mirrors, c, context.subdirs[0], REPODATA_FN)
-        r = requests.head(url, headers=headers)
+        r = session.head(url, headers=headers)
         if r.status_code != 200:
-            continue
-        content_length = 0
+            return False
         try:
-            content_length = int(r.headers.get("Content-Length", 0))
+            int(r.headers.get("Content-Length", 0))
         except Exception as e:
             LOCAL_CONDA_LOG.info(e)
-            continue
-        else:
-            channel = LocalChannels.from_url(url)
-            channels.append(channel.to_channel(local=False, name=c))
-    return channels
+            return False
+        return True
+
+    with ThreadPoolExecutor(max(1, min(threads, len(chnames)))) as p:
+        futures = {p.submit(is_channel, c): c for c in sorted(chnames)}
+        for f in as_completed(futures):
+            if f.result():
+                yield mirrors, futures[f]
 
 
 localSolver = get_local_solver_class
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding:utf-8
+
+import sys
+import json
+import time
+
+from functools import wraps
+from threading import Lock, get_ident
+from contextlib import contextmanager
+from collections import defaultdict
+
+
+class Timings(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.packages = defaultdict(dict)
+        self.lock = Lock()
+
+    def enable(self, origin=None):
+        self.enabled = True
+        self.origin = origin or time.perf_counter()
+        self.spans = []
+        self.packages = defaultdict(dict)
+
+    def disable(self):
+        self.enabled = False
+
+    def record(self, name, start, end, **info):
+        if self.enabled:
+            with self.lock:
+                self.spans.append((name, start, end, get_ident(), info))
+
+    @contextmanager
+    def span(self, name, **info):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), **info)
+
+    def timed(self, name):
+        def wrapper(func):
+            @wraps(func)
+            def inner(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return inner
+        return wrapper
+
+    def package(self, name, **stats):
+        if self.enabled:
+            with self.lock:
+                pkg = self.packages[name]
+                for k, v in stats.items():
+                    pkg[k] = pkg.get(k, 0) + v
+
+    def phases(self):
+        phases = {}
+        for name, start, end, _, _ in self.spans:
+            count, total = phases.get(name, (0, 0.0))
+            phases[name] = (count + 1, total + end - start)
+        return phases
+
+    def summary(self, top=15, file=None):
+        file = file or sys.stderr
+        wall = time.perf_counter() - self.origin
+        print("\n# %-30s %8s %12s %8s" %
+              ("Phase", "Count", "Seconds", "Wall%"), file=file)
+        for name, (count, total) in sorted(self.phases().items(), key=lambda x: -x[1][1]):
+            print("%-32s %8d %12.3f %7.1f%%" % (
+                name, count, total, 100 * total / max(wall, 1e-9)), file=file)
+        print("%-32s %8s %12.3f" % ("wall", "", wall), file=file)
+        if not self.packages:
+            return
+        print("\n# %-38s %12s %10s %12s %10s %10s %10s" % (
+            "Package", "Bytes", "Download", "Throughput", "Wait", "Decompress", "Extract"), file=file)
+        rows = sorted(self.packages.items(), key=lambda x: -sum(
+            x[1].get(k, 0) for k in ("seconds", "decompress", "extract")))
+        for name, pkg in rows[:top]:
+            seconds = pkg.get("seconds", 0)
+            rate = seconds and pkg.get("bytes", 0) / seconds or 0
+            print("%-40.40s %12d %10.3f %8.2fMB/s %10.3f %10.3f %10.3f" % (
+                name, pkg.get("bytes", 0), seconds, rate / 2 ** 20,
+                pkg.get("wait", 0), pkg.get("decompress", 0), pkg.get("extract", 0)), file=file)
+        if len(rows) > top:
+            print("... %d more packages" % (len(rows) - top), file=file)
+
+    def dump(self, path):
+        events = []
+        for name, start, end, tid, info in self.spans:
+            events.append({"name": name, "ph": "X", "pid": 0, "tid": tid,
+                           "ts": (start - self.origin) * 1e6,
+                           "dur": (end - start) * 1e6, "args": info})
+        with open(path, "w") as fo:
+            json.dump({"traceEvents": events, "packages": self.packages}, fo)
+
+
+TIMINGS = Timings()
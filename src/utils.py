@@ -3,32 +3,29 @@
 
 import os
 import re
+import bz2
 import sys
 import time
-import json
 import signal
 import hashlib
 import requests
 import tempfile
 import subprocess
 
-from tqdm import tqdm
-from lxml import etree
-from requests import Session
 
 from textwrap import dedent
 from importlib import import_module
-from collections import defaultdict
+from importlib.util import find_spec
+from collections import defaultdict, deque
 from logging import getLogger, Formatter
-from threading import Lock, RLock, currentThread, Thread
+from threading import Lock, RLock, Event, currentThread, Thread
 from urllib.parse import urlsplit, urlunsplit
 from argparse import ArgumentParser, SUPPRESS
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from os.path import abspath, dirname, basename, exists, isdir, isfile, join
 
 from conda.cli import common
 from conda.cli.main import init_loggers
-from conda.cli.main_search import pretty_record
 from conda.cli.conda_argparse import add_parser_prefix, ArgumentParser as CondaArgumentParser
 
 from conda.common.io import Spinner
@@ -38,12 +35,10 @@ from conda.common.serialize import json_load
 from conda.common.compat import ensure_text_type
 from conda.common.path import paths_equal
 
-from conda.core.solve import Solver
 from conda.core.path_actions import *
 from conda.core.subdir_data import SubdirData
 from conda.core.prefix_data import PrefixData
 from conda.core.index import calculate_channel_urls
-from conda.core.link import PrefixSetup, UnlinkLinkTransaction
 from conda.core.package_cache_data import PackageCacheData
 
 from conda.base.context import context, determine_target_prefix
@@ -57,9 +52,6 @@ except:
 from conda.gateways.logging import StdStreamHandler
 from conda.gateways.disk.test import is_conda_environment
 from conda.gateways.disk.delete import rm_rf, delete_trash, path_is_clean
-from conda.gateways.connection.adapters.s3 import S3Adapter
-from conda.gateways.connection.adapters.ftp import FTPAdapter
-from conda.gateways.connection.adapters.localfs import LocalFSAdapter
 
 from conda.models.match_spec import MatchSpec
 from conda.models.version import VersionOrder
@@ -71,22 +63,70 @@ except ImportError:
     from conda._vendor.auxlib.ish import dals
 
 from conda.utils import human_bytes
-from conda.misc import explicit, touch_nonadmin
 from conda.exceptions import *
 
+# conda.core.path_actions star-exports conda.common.serialize.json (indent=2 by default)
+import json
+
 try:
     from conda.common.path import is_package_file
 except ImportError:
     is_package_file = (
         lambda path: path[-6:] == ".conda" or path[-8:] == ".tar.bz2")
 
+from ._version import __version__
+from .timings import TIMINGS
+from .registry import LOCAL_CONDA_DIR, REGISTRY_FN, REPODATA_FN
 
-from conda_env.specs import detect
 
-from ._version import __version__
+class LazyImport(object):
+
+    def __init__(self, module, attr=None):
+        self._module = module
+        self._attr = attr
+        self._obj = None
+
+    def _load(self):
+        if self._obj is None:
+            obj = import_module(self._module)
+            self._obj = self._attr and getattr(obj, self._attr) or obj
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+
+tqdm = LazyImport("tqdm", "tqdm")
+etree = LazyImport("lxml.etree")
+detect = LazyImport("conda_env.specs", "detect")
+explicit = LazyImport("conda.misc", "explicit")
+touch_nonadmin = LazyImport("conda.misc", "touch_nonadmin")
+pretty_record = LazyImport("conda.cli.main_search", "pretty_record")
+PrefixSetup = LazyImport("conda.core.link", "PrefixSetup")
+UnlinkLinkTransaction = LazyImport("conda.core.link", "UnlinkLinkTransaction")
 
 DEFAULT_THREADS = 10
-REPODATA_FN = "repodata.json"
+DEFAULT_POOL_SIZE = DEFAULT_THREADS * 2
+DEFAULT_POOL_HOSTS = 16
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_PER_HOST = 16
+DEFAULT_SEGMENTS = 4
+DEFAULT_JOBS = min(os.cpu_count() or 1, 16)
+SEGMENT_MIN_SIZE = 64 * 2 ** 20
+SEGMENT_SIZE = 16 * 2 ** 20
+TRANSFER_TIMEOUT = (10, 30)
+REPODATA_STATE_FN = ".repodata_state.json"
+JLAP_FN = "repodata.jlap"
+MIRROR_LIST_FN = ".channels.json"
+DEFAULT_DISCOVER_TTL = 24 * 3600
+MIRROR_SCORES_FN = ".mirror_scores.json"
+SOLVE_CACHE_DIR = ".solve_cache"
+DEFAULT_SOLVE_CACHE_SIZE = 64
+PRUNED_DIR = ".pruned"
+DEFAULT_PRUNED_SIZE = 16
 DEFAULT_MIRROR = (
     "https://mirrors.tuna.tsinghua.edu.cn/anaconda/cloud",
     "https://mirrors.tuna.tsinghua.edu.cn/anaconda/pkgs",
@@ -121,12 +161,38 @@ def _get_log():
 LOCAL_CONDA_LOG = _get_log()
 
 default_headers = {
-    'Connection': 'close',
     'Accept-Encoding': 'identity',
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/104.0.0.0 Safari/537.36'
 }
 
 
+_sessions = {}
+_session_lock = Lock()
+
+
+def get_session(pool_size=0):
+    size = max(pool_size, DEFAULT_POOL_SIZE)
+    with _session_lock:
+        session = _sessions.get(os.getpid())
+        if session is None:
+            from conda.gateways.connection.adapters.s3 import S3Adapter
+            from conda.gateways.connection.adapters.ftp import FTPAdapter
+            from conda.gateways.connection.adapters.localfs import LocalFSAdapter
+            session = requests.Session()
+            session.mount("ftp://", FTPAdapter())
+            session.mount("s3://", S3Adapter())
+            session.mount("file://", LocalFSAdapter())
+            session.pool_size = 0
+            _sessions[os.getpid()] = session
+        if session.pool_size < size:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=DEFAULT_POOL_HOSTS, pool_maxsize=size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.pool_size = size
+    return session
+
+
 def flatten(x):
     return [y for l in x for y in flatten(
         l)] if isinstance(x, (list, tuple)) else [x]
@@ -144,6 +210,52 @@ def add_logging_debug(p):
                    )
 
 
+def add_parser_timings(p):
+    p.add_argument("--timings",
+                   action="store_true", default=False,
+                   help="print time spent in each phase and per package when finished"
+                   )
+    p.add_argument("--profile",
+                   metavar="<file>",
+                   help="write cProfile stats of the run to this file and a json trace "
+                   "of the timed phases to <file>.json"
+                   )
+
+
+def add_parser_connections(p):
+    p.add_argument("--max-connections",
+                   metavar="int", type=int, default=DEFAULT_MAX_CONNECTIONS,
+                   help="max concurrent downloads in total, %(default)s by default"
+                   )
+    p.add_argument("--per-host",
+                   metavar="int", type=int, default=DEFAULT_PER_HOST,
+                   help="max concurrent downloads per host, concurrency is adjusted "
+                   "between 1 and this value by observed throughput, %(default)s by default"
+                   )
+    p.add_argument("--segments",
+                   metavar="int", type=int, default=DEFAULT_SEGMENTS,
+                   help="download packages larger than %s in this number of parallel "
+                   "byte ranges, 1 to disable, %%(default)s by default" % human_bytes(SEGMENT_MIN_SIZE)
+                   )
+    p.add_argument("--hedge",
+                   action="store_true", default=False,
+                   help="start a duplicate download from another cached mirror when a "
+                   "package download stalls or is slower than most, keep the first to finish"
+                   )
+    p.add_argument("--multi-mirror",
+                   action="store_true", default=False,
+                   help="fetch the byte ranges of large packages from all cached mirrors of the channel"
+                   )
+
+
+def add_parser_jobs(p):
+    p.add_argument("-j", "--jobs",
+                   metavar="int", type=int, default=DEFAULT_JOBS,
+                   help="number of processes loading cached channels/subdirs in parallel, "
+                   "%(default)s by default"
+                   )
+
+
 def add_parse_no_default_channels(p):
     p.add_argument("-ndc", "--no-default-channels", action="store_true", default=False,
                    help="Do not search default or %s/.condarc channels. Requires -c / --channel." % os.getenv(
@@ -179,6 +291,22 @@ def add_parser_local_solver(p):
     )
 
 
+def add_parser_solve_cache(p):
+    p.add_argument("--no-solve-cache",
+                   action="store_true", default=False,
+                   help="always run the solver, do not reuse or store solutions in %s" % join(
+                       LOCAL_CONDA_DIR, SOLVE_CACHE_DIR)
+                   )
+
+
+def add_parser_prune(p):
+    p.add_argument("--no-prune",
+                   action="store_true", default=False,
+                   help="give the solver whole channels instead of only the dependency "
+                   "closure of the requested and installed packages"
+                   )
+
+
 def new_channel_names(channels, args):
     chl_names = list(channels)
     if hasattr(args, "no_default_channels") and args.no_default_channels:
@@ -190,18 +318,285 @@ def new_channel_names(channels, args):
     return tuple(chl_names)
 
 
-def fast_url(urls):
-    delt = 60
-    time_record = []
-    for url in urls:
-        u = urlsplit(url)
-        url_base = urlunsplit((u.scheme, u.netloc, "", "", ""))
-        start = time.time()
-        res = requests.get(url_base)
-        if res.status_code != 404:
-            delt = time.time() - start
-        time_record.append((url, delt))
-    return [i[0] for i in sorted(time_record, key=lambda x: float(x[1]))]
+def fast_url(urls, suffix=""):
+    return get_mirror_scores().rank(urls, suffix=suffix)
+
+
+def repodata_suffixes():
+    suffixes = [".bz2", ""]
+    if find_spec("zstandard") is not None:
+        suffixes.insert(0, ".zst")
+    return tuple(suffixes)
+
+
+class TruncatedDownloadError(CondaError):
+    pass
+
+
+def get_decompressor(kind):
+    if not kind:
+        return None
+    if kind == "zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise CondaError("zstandard is required to decompress %s" % kind)
+        return zstandard.ZstdDecompressor().decompressobj()
+    elif kind == "bz2":
+        return bz2.BZ2Decompressor()
+    raise CondaError("unknown repodata compression: %s" % kind)
+
+
+def _json_pointer(path):
+    if not path:
+        return []
+    return [p.replace("~1", "/").replace("~0", "~") for p in path.split("/")[1:]]
+
+
+def _json_parent(doc, tokens):
+    for t in tokens[:-1]:
+        doc = doc[int(t)] if isinstance(doc, list) else doc[t]
+    return doc
+
+
+def _json_get(doc, tokens):
+    for t in tokens:
+        doc = doc[int(t)] if isinstance(doc, list) else doc[t]
+    return doc
+
+
+def apply_json_patch(doc, patch):
+    for op in patch:
+        action = op["op"]
+        tokens = _json_pointer(op["path"])
+        if action == "test":
+            if _json_get(doc, tokens) != op["value"]:
+                raise CondaError("json patch test failed: %s" % op["path"])
+            continue
+        if action in ("move", "copy"):
+            src = _json_pointer(op["from"])
+            value = _json_get(doc, src)
+            if action == "copy":
+                value = json.loads(json.dumps(value))
+            else:
+                parent = _json_parent(doc, src)
+                parent.pop(int(src[-1]) if isinstance(parent, list) else src[-1])
+        elif action != "remove":
+            value = op["value"]
+        if not tokens:
+            doc = value
+            continue
+        parent = _json_parent(doc, tokens)
+        key = tokens[-1]
+        if isinstance(parent, list):
+            if action in ("add", "move", "copy"):
+                if key == "-":
+                    parent.append(value)
+                else:
+                    parent.insert(int(key), value)
+            elif action == "remove":
+                parent.pop(int(key))
+            else:
+                parent[int(key)] = value
+        elif action == "remove":
+            del parent[key]
+        else:
+            parent[key] = value
+    return doc
+
+
+def update_hash(hashers, filename, start, end):
+    with open(filename, "rb") as fi:
+        fi.seek(start)
+        while start < end:
+            b = fi.read(min(2 ** 20, end - start))
+            if not b:
+                break
+            for h in hashers:
+                h.update(b)
+            start += len(b)
+
+
+def accept_ranges(url):
+    try:
+        res = get_session().head(url, headers=default_headers, allow_redirects=True)
+    except Exception:
+        return False
+    return res.status_code == 200 and res.headers.get("Accept-Ranges", "") == "bytes"
+
+
+def fetch_segments(urls, outpath, size, offset=0, progress=None, hashers=(), segments=DEFAULT_SEGMENTS):
+    nseg = max(1, min(segments, -(-(size - offset) // SEGMENT_SIZE)))
+    step = -(-(size - offset) // nseg)
+    ranges = [(s, min(s + step, size)) for s in range(offset, size, step)]
+    lock = Lock()
+    with open(outpath, isfile(outpath) and "r+b" or "w+b") as fo:
+        fo.truncate(size)
+
+    def fetch(url, start, end):
+        headers = default_headers.copy()
+        headers["Range"] = "bytes=%d-%d" % (start, end - 1)
+        with get_session().get(url, headers=headers, stream=True) as res:
+            if res.status_code != 206:
+                raise CondaError(
+                    "range request not supported: %s (%s)" % (url, res.status_code))
+            with open(outpath, "r+b") as fo:
+                fo.seek(start)
+                for chunk in res.iter_content(chunk_size=2 ** 16):
+                    if chunk:
+                        fo.write(chunk[:end - fo.tell()])
+                        if progress:
+                            with lock:
+                                progress(len(chunk))
+                if fo.tell() != end:
+                    raise CondaError("incomplete range %d-%d of %s" %
+                                     (start, end, url))
+
+    if hashers and offset:
+        update_hash(hashers, outpath, 0, offset)
+    with ThreadPoolExecutor(len(ranges)) as p:
+        futures = [p.submit(fetch, urls[n % len(urls)], start, end)
+                   for n, (start, end) in enumerate(ranges)]
+        for f, (start, end) in zip(futures, ranges):
+            f.result()
+            if hashers:
+                update_hash(hashers, outpath, start, end)
+
+
+class HedgePolicy(object):
+
+    min_samples = 5
+
+    def __init__(self, percentile=10, first_byte=5.0, grace=3.0, samples=200):
+        self.percentile = percentile
+        self.first_byte = first_byte
+        self.grace = grace
+        self.rates = deque(maxlen=samples)
+        self.latencies = deque(maxlen=samples)
+        self.lock = Lock()
+
+    @staticmethod
+    def _percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+    def record(self, latency, rate):
+        with self.lock:
+            self.latencies.append(latency)
+            self.rates.append(rate)
+
+    def first_byte_timeout(self):
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return self.first_byte
+            return max(1.0, 3 * self._percentile(self.latencies, 90))
+
+    def min_rate(self):
+        with self.lock:
+            if len(self.rates) < self.min_samples:
+                return 0.0
+            return self._percentile(self.rates, self.percentile)
+
+    def should_hedge(self, transfer):
+        elapsed = time.time() - transfer.start_time
+        if transfer.first_byte is None:
+            return elapsed > self.first_byte_timeout()
+        if elapsed < transfer.first_byte + self.grace:
+            return False
+        return transfer.rate() < self.min_rate()
+
+
+class Transfer(Thread):
+
+    def __init__(self, url, outpath, progress=None):
+        super(Transfer, self).__init__()
+        self.daemon = True
+        self.url = url
+        self.outpath = outpath
+        self.progress = progress
+        self.md5 = hashlib.md5()
+        self.nbytes = 0
+        self.first_byte = None
+        self.error = None
+        self.start_time = time.time()
+        self.cancelled = Event()
+        self.done = Event()
+
+    def rate(self):
+        elapsed = time.time() - self.start_time - (self.first_byte or 0)
+        return self.nbytes / max(elapsed, 1e-3)
+
+    def run(self):
+        try:
+            with get_session().get(self.url, headers=default_headers, stream=True,
+                                   timeout=TRANSFER_TIMEOUT) as res:
+                res.raise_for_status()
+                with open(self.outpath, "wb") as fo:
+                    for chunk in res.iter_content(chunk_size=2 ** 14):
+                        if self.cancelled.is_set():
+                            break
+                        if self.first_byte is None:
+                            self.first_byte = time.time() - self.start_time
+                        if chunk:
+                            fo.write(chunk)
+                            self.md5.update(chunk)
+                            self.nbytes += len(chunk)
+                            if self.progress:
+                                self.progress()
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.cancelled.is_set() and isfile(self.outpath):
+                os.remove(self.outpath)
+            self.done.set()
+
+
+def hedged_fetch(urls, outpath, policy, md5=None, progress=None):
+    lock = Lock()
+    shown = [0]
+    transfers = []
+
+    def report():
+        with lock:
+            cur = max(t.nbytes for t in transfers)
+            if progress and cur > shown[0]:
+                progress(cur - shown[0])
+                shown[0] = cur
+
+    def start(url):
+        t = Transfer(url, "%s.h%d" % (outpath, len(transfers)), report)
+        transfers.append(t)
+        t.start()
+
+    start(urls[0])
+    winner = None
+    while winner is None:
+        transfers[-1].done.wait(0.1)
+        for t in transfers:
+            if not t.done.is_set() or t.error:
+                continue
+            if md5 and t.md5.hexdigest() != md5:
+                t.error = ChecksumMismatchError(
+                    t.url, outpath, "md5", md5, t.md5.hexdigest())
+                continue
+            winner = t
+            break
+        if winner is not None:
+            break
+        if all(t.done.is_set() for t in transfers) and len(transfers) >= len(urls):
+            raise transfers[-1].error or transfers[0].error
+        if len(transfers) < len(urls):
+            primary = transfers[-1]
+            if (primary.done.is_set() and primary.error) or policy.should_hedge(primary):
+                LOCAL_CONDA_LOG.debug("hedge %s with %s",
+                                      primary.url, urls[len(transfers)])
+                start(urls[len(transfers)])
+    for t in transfers:
+        if t is not winner:
+            t.cancelled.set()
+    os.replace(winner.outpath, outpath)
+    policy.record(winner.first_byte or 0, winner.rate())
+    return winner
 
 
 def get_md5(filename):
@@ -238,6 +633,132 @@ class Log(object):
         return getLogger('localconda')
 
 
+class RepodataState(object):
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if isfile(path):
+            try:
+                with open(path) as fi:
+                    self.data = json.load(fi)
+            except ValueError:
+                self.data = {}
+        self.data.setdefault("channels", {})
+
+    def get(self, name, subdir):
+        return self.data["channels"].setdefault(name, {}).setdefault(subdir, {})
+
+    def save(self):
+        mkdir(dirname(self.path))
+        with open(self.path, "w") as fo:
+            json.dump(self.data, fo, indent=2)
+
+
+class MirrorScores(object):
+
+    ttl = 24 * 3600
+    half_life = 7 * 24 * 3600
+    probe_bytes = 2 ** 18
+    probe_timeout = 10
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.data = {}
+        if isfile(path):
+            try:
+                with open(path) as fi:
+                    self.data = json.load(fi)
+            except ValueError:
+                self.data = {}
+        self.data.setdefault("mirrors", {})
+
+    @staticmethod
+    def key(url):
+        u = urlsplit(url)
+        return urlunsplit((u.scheme, u.netloc, "", "", ""))
+
+    def update(self, url, latency=0.0, throughput=0.0, error=False):
+        now = time.time()
+        with self.lock:
+            rec = self.data["mirrors"].setdefault(self.key(url), {
+                "latency": 0.0, "throughput": 0.0, "errors": 0.0, "weight": 0.0, "time": now})
+            decay = 0.5 ** (max(now - rec["time"], 0) / self.half_life)
+            weight = rec["weight"] * decay
+            rec["errors"] *= decay
+            if error:
+                rec["errors"] += 1
+            else:
+                rec["latency"] = (rec["latency"] * weight +
+                                  latency) / (weight + 1)
+                rec["throughput"] = (
+                    rec["throughput"] * weight + throughput) / (weight + 1)
+                weight += 1
+            rec["weight"] = weight
+            rec["time"] = now
+
+    def cost(self, url):
+        rec = self.data["mirrors"].get(self.key(url))
+        if not rec or not rec["weight"] or not rec["throughput"]:
+            return float("inf")
+        cost = rec["latency"] + 2 ** 20 / rec["throughput"]
+        return cost * (1 + rec["errors"])
+
+    def is_stale(self, url):
+        rec = self.data["mirrors"].get(self.key(url))
+        return not rec or time.time() - rec["time"] > self.ttl
+
+    def probe(self, url, target=None):
+        headers = default_headers.copy()
+        headers["Range"] = "bytes=0-%d" % (self.probe_bytes - 1)
+        start = time.time()
+        try:
+            with get_session().get(target or url, headers=headers, stream=True, timeout=self.probe_timeout) as res:
+                latency = time.time() - start
+                res.raise_for_status()
+                size = 0
+                for chunk in res.iter_content(chunk_size=2 ** 14):
+                    size += len(chunk)
+                    if size >= self.probe_bytes:
+                        break
+        except Exception as e:
+            LOCAL_CONDA_LOG.debug("probe %s failed: %s", url, e)
+            self.update(url, error=True)
+        else:
+            elapsed = max(time.time() - start - latency, 1e-3)
+            self.update(url, latency, size / elapsed)
+
+    def rank(self, urls, suffix=""):
+        urls = list(urls)
+        stale = {}
+        for url in urls:
+            if self.is_stale(url):
+                stale.setdefault(self.key(url), url)
+        if stale:
+            with ThreadPoolExecutor(len(stale)) as p:
+                for url in stale.values():
+                    p.submit(self.probe, url, suffix and join(url, suffix))
+            self.save()
+        return sorted(urls, key=self.cost)
+
+    def save(self):
+        mkdir(dirname(self.path))
+        with self.lock:
+            with open(self.path, "w") as fo:
+                json.dump(self.data, fo, indent=2)
+
+
+_mirror_scores = []
+
+
+def get_mirror_scores():
+    if not _mirror_scores:
+        _mirror_scores.append(MirrorScores(
+            join(LOCAL_CONDA_DIR, MIRROR_SCORES_FN)))
+    return _mirror_scores[0]
+
+
 def cstring(string, mode=0, fore=37):
     s = '\033[%sm\033[%sm%s\033[0m'
     return s % (mode, fore, string)
@@ -247,9 +768,13 @@ class Download(object):
 
     bar_format = "{desc}{bar} | {percentage:3.0f}% "
 
-    def __init__(self, axn, exn, lock=None):
+    def __init__(self, axn, exn, lock=None, mirrors=(), segments=DEFAULT_SEGMENTS, multi_mirror=False, hedge=None):
         self.axn = axn
         self.exn = exn
+        self.mirrors = list(mirrors)
+        self.segments = segments
+        self.multi_mirror = multi_mirror
+        self.hedge = hedge
         axn.verify()
         exn.verify()
         self.lock = lock or Lock()
@@ -287,47 +812,60 @@ class Download(object):
             desc += "%-9s | " % size_str
         md5 = hashlib.md5()
         LOCAL_CONDA_LOG.debug("download from %s to %s", url, outpath)
-        session = Session()
-        session.mount("ftp://", FTPAdapter())
-        session.mount("s3://", S3Adapter())
-        session.mount("file://", LocalFSAdapter())
-        with session.get(url, headers=headers, stream=True) as res:
-            if res.headers.get("Accept-Ranges", "") != "bytes":
-                if isfile(outpath):
-                    os.remove(outpath)
-                    offset = 0
-            content_length = float(res.headers.get('Content-Length', 0))
-            cur = currentThread()
-            pos = None if cur.name == "MainThread" else int(
-                cur.name.rsplit("_", 1)[1])
-            with tqdm(lock_args=(False,), desc=desc, position=pos, initial=offset, total=content_length, bar_format=self.bar_format, ascii=True, disable=context.quiet) as progress_bar:
-                with open(outpath, "ab") as fo:
-                    for chunk in res.iter_content(chunk_size=2 ** 14):
-                        if chunk:
-                            fo.write(chunk)
-                            fo.flush()
-                            md5.update(chunk)
-                            progress_bar.update(len(chunk))
+        pos = self.bar_position()
+        if self.segments > 1 and size and size - offset >= SEGMENT_MIN_SIZE and accept_ranges(url):
+            urls = [url]
+            if self.multi_mirror:
+                urls.extend(m for m in self.mirrors if m != url)
+            with tqdm(lock_args=(False,), desc=desc, position=pos, initial=offset, total=size, bar_format=self.bar_format, ascii=True, disable=context.quiet) as progress_bar:
+                fetch_segments(urls, outpath, size, offset,
+                               progress_bar.update, (md5,), self.segments)
+        elif self.hedge and [m for m in self.mirrors if m != url]:
+            urls = [url] + [m for m in self.mirrors if m != url]
+            if isfile(outpath):
+                os.remove(outpath)
+            with tqdm(lock_args=(False,), desc=desc, position=pos, initial=0, total=size, bar_format=self.bar_format, ascii=True, disable=context.quiet) as progress_bar:
+                winner = hedged_fetch(urls, outpath, self.hedge,
+                                      axn.md5, progress_bar.update)
+            md5, url = winner.md5, winner.url
+        else:
+            session = get_session()
+            with session.get(url, headers=headers, stream=True) as res:
+                if res.status_code != 206:
+                    if isfile(outpath):
+                        os.remove(outpath)
+                        offset = 0
+                if offset:
+                    update_hash((md5,), outpath, 0, offset)
+                content_length = float(res.headers.get('Content-Length', 0))
+                with tqdm(lock_args=(False,), desc=desc, position=pos, initial=offset, total=offset + content_length, bar_format=self.bar_format, ascii=True, disable=context.quiet) as progress_bar:
+                    with open(outpath, "ab") as fo:
+                        for chunk in res.iter_content(chunk_size=2 ** 14):
+                            if chunk:
+                                fo.write(chunk)
+                                fo.flush()
+                                md5.update(chunk)
+                                progress_bar.update(len(chunk))
         actual_checksum = md5.hexdigest()
         if actual_checksum != axn.md5:
             LOCAL_CONDA_LOG.debug("md5 mismatch for download: %s (%s != %s)",
                                   url, actual_checksum, axn.md5)
             raise ChecksumMismatchError(
-                url, target_full_path, "md5", axn.md5, actual_checksum
+                url, outpath, "md5", axn.md5, actual_checksum
             )
         actual_size = os.path.getsize(outpath)
         if actual_size != size:
             LOCAL_CONDA_LOG.debug("size mismatch for download: %s (%s != %s)",
                                   url, actual_size, size)
             raise ChecksumMismatchError(
-                url, target_full_path, "size", size, actual_size)
+                url, outpath, "size", size, actual_size)
         with self.lock:
             self.target_package_cache._urls_data.add_url(url)
 
     @classmethod
-    def download_file(cls, url, outpath, md5=None):
+    def download_file(cls, url, outpath, md5=None, state=None, decompress=None, segments=DEFAULT_SEGMENTS):
         subdir = basename(dirname(url))
-        if url.endswith("json"):
+        if REPODATA_FN in basename(url):
             chn = basename(dirname(dirname(url)))
             name = chn + "(%s)" % subdir
         else:
@@ -337,51 +875,224 @@ class Download(object):
             if md5 and get_md5(outpath) == md5:
                 LOCAL_CONDA_LOG.info(
                     "%s already exists and up-to-date", name)
-                return
-            else:
-                os.remove(outpath)
+                return state
         headers = default_headers.copy()
+        if state is not None:
+            headers.update(cls.conditional_headers(url, outpath, state))
         LOCAL_CONDA_LOG.debug("download from %s to %s", url, outpath)
         _md5 = hashlib.md5()
-        with requests.get(url, headers=headers, stream=True) as res:
+        _blake2 = hashlib.blake2b(digest_size=32)
+        tmpfile = outpath + ".part"
+        decompressor = get_decompressor(decompress)
+        with get_session().get(url, headers=headers, stream=True) as res:
+            if res.status_code == 304:
+                LOCAL_CONDA_LOG.info(
+                    "%s not modified, skip download", name)
+                state["checked"] = int(time.time())
+                return state
+            res.raise_for_status()
             content_length = float(res.headers.get('Content-Length', 0))
-            cur = currentThread()
-            pos = None if cur.name == "MainThread" else int(
-                cur.name.rsplit("_", 1)[1])
-            with tqdm(desc=desc, position=pos, initial=0, total=content_length, bar_format=cls.bar_format, ascii=True, disable=context.quiet) as progress_bar:
-                with open(outpath, "ab") as fo:
-                    for chunk in res.iter_content(chunk_size=2 ** 14):
-                        if chunk:
-                            fo.write(chunk)
-                            fo.flush()
-                            _md5.update(chunk)
-                            progress_bar.update(len(chunk))
+            resp_headers = res.headers
+            segmented = segments > 1 and not decompressor and content_length >= SEGMENT_MIN_SIZE and \
+                resp_headers.get("Accept-Ranges", "") == "bytes"
+            with tqdm(desc=desc, position=cls.bar_position(), initial=0, total=content_length, bar_format=cls.bar_format, ascii=True, disable=context.quiet) as progress_bar:
+                if segmented:
+                    res.close()
+                    fetch_segments([res.url], tmpfile, int(content_length), 0,
+                                   progress_bar.update, (_md5, _blake2), segments)
+                else:
+                    with open(tmpfile, "wb") as fo:
+                        for chunk in res.iter_content(chunk_size=2 ** 14):
+                            if chunk:
+                                _md5.update(chunk)
+                                progress_bar.update(len(chunk))
+                                if decompressor:
+                                    chunk = decompressor.decompress(chunk)
+                                _blake2.update(chunk)
+                                fo.write(chunk)
+        if decompressor and not getattr(decompressor, "eof", True):
+            os.remove(tmpfile)
+            raise TruncatedDownloadError(
+                "compressed stream of %s ended early" % url)
         download_md5 = _md5.hexdigest()
         if md5 and md5 != download_md5:
             LOCAL_CONDA_LOG.debug("md5 mismatch for download: %s (%s != %s)",
                                   url, download_md5, md5)
+            os.remove(tmpfile)
             raise ChecksumMismatchError(
                 url, outpath, "md5", md5, download_md5
             )
+        os.replace(tmpfile, outpath)
+        if state is not None:
+            state.update(
+                url=url,
+                etag=resp_headers.get("ETag", ""),
+                last_modified=resp_headers.get("Last-Modified", ""),
+                size=os.path.getsize(outpath),
+                mtime=os.path.getmtime(outpath),
+                checked=int(time.time()),
+                blake2_256=_blake2.hexdigest(),
+            )
+            state.pop("jlap", None)
+        return state
 
-    def run(self):
-        try:
-            self.download()
-        except Exception as e:
-            self.axn.reverse()
-            return e
+    @staticmethod
+    def bar_position():
+        cur = currentThread()
+        if cur.name == "MainThread":
+            return None
+        return int(cur.name.rsplit("_", 1)[1])
+
+    @classmethod
+    def download_repodata(cls, url, outpath, state=None, compressed=False, jlap=False, segments=DEFAULT_SEGMENTS):
+        if jlap and state is not None and cls.is_cached(url, outpath, state):
+            try:
+                if cls.patch_repodata(url, outpath, state):
+                    return state
+            except Exception as e:
+                LOCAL_CONDA_LOG.debug("patch %s failed: %s", outpath, e)
+        suffixes = compressed and repodata_suffixes() or ("",)
+        for suffix in suffixes:
+            try:
+                return cls.download_file(url + suffix, outpath, state=state,
+                                         decompress=suffix.strip(".") or None, segments=segments)
+            except requests.HTTPError as e:
+                if suffix and e.response.status_code == 404:
+                    LOCAL_CONDA_LOG.debug("%s not found", url + suffix)
+                    continue
+                raise
+            except TruncatedDownloadError as e:
+                LOCAL_CONDA_LOG.warning("%s, fall back to the next format", e)
+
+    @classmethod
+    def patch_repodata(cls, url, outpath, state):
+        subdir = basename(dirname(url))
+        name = basename(dirname(dirname(url))) + "(%s)" % subdir
+        jlap_url = join(dirname(url), JLAP_FN)
+        jlap_state = state.get("jlap", {})
+        offset = 0
+        if jlap_state.get("url") == jlap_url:
+            offset = jlap_state.get("offset", 0)
+        headers = default_headers.copy()
+        if offset:
+            headers["Range"] = "bytes=%d-" % offset
+        with get_session().get(jlap_url, headers=headers) as res:
+            if res.status_code == 404:
+                return False
+            res.raise_for_status()
+            content = res.content
+        if res.status_code == 206:
+            iv = bytes.fromhex(jlap_state["iv"])
+        else:
+            offset = 0
+        lines = content.split(b"\n")
+        if lines and not lines[-1]:
+            lines.pop()
+        if not offset:
+            first = lines.pop(0)
+            offset = len(first) + 1
+            iv = bytes.fromhex(first.decode())
+        if len(lines) < 2:
+            return False
+        checksum = lines.pop().decode().strip()
+        chain = iv
+        for line in lines:
+            iv = chain
+            chain = hashlib.blake2b(line, key=chain, digest_size=32).digest()
+        if chain.hex() != checksum:
+            raise ChecksumMismatchError(
+                jlap_url, outpath, "blake2_256", checksum, chain.hex())
+        offset += sum(len(line) + 1 for line in lines[:-1])
+        latest = json.loads(lines[-1])["latest"]
+        patches = {}
+        for line in lines[:-1]:
+            p = json.loads(line)
+            patches[p["to"]] = p
+        chain = []
+        h = latest
+        while h != state["blake2_256"]:
+            if h not in patches:
+                return False
+            chain.append(patches[h])
+            h = patches[h]["from"]
+        if chain:
+            with open(outpath) as fi:
+                repodata = json.load(fi)
+            for p in reversed(chain):
+                repodata = apply_json_patch(repodata, p["patch"])
+            data = json.dumps(repodata, indent=2, sort_keys=True).encode()
+            digest = hashlib.blake2b(data, digest_size=32).hexdigest()
+            if digest != latest:
+                LOCAL_CONDA_LOG.debug("%s patched hash mismatch (%s != %s)",
+                                      name, digest, latest)
+                return False
+            tmpfile = outpath + ".part"
+            with open(tmpfile, "wb") as fo:
+                fo.write(data)
+            os.replace(tmpfile, outpath)
+            LOCAL_CONDA_LOG.info(
+                "%s patched to latest (%d patches)", name, len(chain))
         else:
-            self.axn.cleanup()
+            LOCAL_CONDA_LOG.info("%s not modified, skip download", name)
+        state.update(
+            etag="",
+            last_modified="",
+            size=os.path.getsize(outpath),
+            mtime=os.path.getmtime(outpath),
+            checked=int(time.time()),
+            blake2_256=latest,
+            jlap={"url": jlap_url, "offset": offset, "iv": iv.hex()},
+        )
+        return True
+
+    @staticmethod
+    def is_cached(url, outpath, state):
+        if not isfile(outpath) or not state.get("blake2_256"):
+            return False
+        return os.path.getsize(outpath) == state.get("size") and \
+            os.path.getmtime(outpath) == state.get("mtime")
+
+    @classmethod
+    def conditional_headers(cls, url, outpath, state):
+        headers = {}
+        if state.get("url") != url or not cls.is_cached(url, outpath, state):
+            return headers
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+        return headers
+
+    def run(self):
+        urls = [self.axn.url] + self.mirrors
+        for n, url in enumerate(urls, 1):
+            self.axn.url = url
+            try:
+                self.download()
+            except Exception as e:
+                get_mirror_scores().update(url, error=True)
+                if isinstance(e, ChecksumMismatchError) and isfile(self.axn.target_full_path):
+                    os.remove(self.axn.target_full_path)
+                if n < len(urls):
+                    LOCAL_CONDA_LOG.info(
+                        "download %s failed, retry from %s", url, urls[n])
+                    continue
+                self.axn.reverse()
+                return e
+            else:
+                self.axn.cleanup()
+                return
 
 
 class Extract(object):
 
-    def __init__(self, exn):
+    def __init__(self, exn, insert=True):
         self.exn = exn
         exn.verify()
         self.target_pkgs_dir = exn.target_pkgs_dir
         mkdir(self.target_pkgs_dir)
-        self.target_package_cache = PackageCacheData(self.target_pkgs_dir)
+        self.target_package_cache = insert and PackageCacheData(
+            self.target_pkgs_dir) or None
 
     def extract(self):
         exn = self.exn
@@ -409,24 +1120,27 @@ class Extract(object):
         else:
             repodata_record = PackageRecord.from_objects(
                 exn.record_or_spec, raw_index_json)
-        repodata_record_path = join(
-            exn.target_full_path, 'info', 'repodata_record.json')
-        write_as_json_to_file(repodata_record_path, repodata_record)
         package_cache_record = PackageCacheRecord.from_objects(
             repodata_record,
             package_tarball_full_path=exn.source_full_path,
             extracted_package_dir=exn.target_full_path,
         )
-        self.target_package_cache.insert(package_cache_record)
+        if self.target_package_cache is not None:
+            repodata_record_path = join(
+                exn.target_full_path, 'info', 'repodata_record.json')
+            write_as_json_to_file(repodata_record_path, repodata_record)
+            self.target_package_cache.insert(package_cache_record)
+        return package_cache_record
 
     def run(self):
         try:
-            self.extract()
+            record = self.extract()
         except Exception as e:
             self.exn.reverse()
             raise e
         else:
             self.exn.cleanup()
+            return record
 
 
 def Decompress(exn):
@@ -435,6 +1149,22 @@ def Decompress(exn):
     extract_tarball(exn.source_full_path, exn.target_full_path)
 
 
+def DecompressExtract(exn):
+    start = time.perf_counter()
+    Decompress(exn)
+    decompressed = time.perf_counter()
+    record = Extract(exn, insert=False).run()
+    return record, decompressed - start, time.perf_counter() - decompressed
+
+
+def register_package_cache(records):
+    caches = {}
+    for pkgs_dir, record in records:
+        if pkgs_dir not in caches:
+            caches[pkgs_dir] = PackageCacheData(pkgs_dir)
+        caches[pkgs_dir].insert(record)
+
+
 def get_solver_key(key=None):
     if not key:
         if hasattr(context, "solver"):
@@ -459,7 +1189,7 @@ def get_solver_key(key=None):
 
 def is_repo_url(url):
     headers = default_headers
-    res = requests.get(url=url, headers=headers)
+    res = get_session().get(url=url, headers=headers)
     if res.status_code >= 400:
         return (False, res.status_code)
     return (True, res.status_code)